@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the selfvalidator spot check matching, for one answer
+and for a whole step of answers to the same query.
+
+Run from the repository root:
+
+    python benchmarks/bench_matching.py
+"""
+
+import json
+import random
+import string
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "subnet"))
+
+from utils.matching import GroundTruth  # noqa: E402
+
+SIZES = [50, 100, 500]
+MINERS = 256
+
+
+def legacy_percentage(arr1: list[dict], arr2: list[dict]) -> float:
+    # the list based implementation the selfvalidator used before utils.matching
+    if not arr1 or not arr2:
+        return 0
+    matches = 0
+    arr2_texts = [tweet['text'] for tweet in arr2]
+    for tweet1 in arr1:
+        if tweet1['text'] in arr2_texts:
+            matches += 1
+    return (matches / len(arr1)) * 100
+
+
+def make_tweets(rng: random.Random, count: int) -> list[dict]:
+    # realistic payloads: 19 digit ids and texts of 100-280 characters sharing a common prefix
+    tweets = []
+    for i in range(count):
+        words = " ".join(
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(rng.randint(15, 40))
+        )
+        tweets.append({
+            "id": str(1780000000000000000 + i),
+            "author_id": str(rng.randint(10 ** 6, 10 ** 18)),
+            "created_at": "2024-04-17T05:00:00.000Z",
+            "text": ("$BTC breaking: " + words)[:280],
+        })
+    return tweets
+
+
+def bench(fn) -> float:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def main() -> None:
+    rng = random.Random(17)
+    print(f"{'tweets':>8} {'mode':>8} {'legacy (ms)':>12} {'engine (ms)':>12} {'speedup':>8}")
+    for size in SIZES:
+        truth = make_tweets(rng, size)
+        # most miners return the ground truth in another order, some miss or alter part of it
+        answers = {}
+        for uid in range(MINERS):
+            answer = [dict(tweet) for tweet in rng.sample(truth, len(truth))]
+            for tweet in answer[:rng.randint(0, size // 5)]:
+                tweet["text"] += " "
+            # answers arrive as JSON, so they share no string objects with the ground truth
+            answers[uid] = json.loads(json.dumps(answer[:len(answer) - rng.randint(0, size // 10)]))
+        answer = answers[0]
+
+        legacy = bench(lambda: legacy_percentage(truth, answer))
+        engine = bench(lambda: GroundTruth(truth).match(answer))
+        print(f"{size:>8} {'single':>8} {legacy * 1000:>12.3f} {engine * 1000:>12.3f} {legacy / engine:>7.1f}x")
+
+        legacy = bench(lambda: {uid: legacy_percentage(truth, a) for uid, a in answers.items()})
+        engine = bench(lambda: GroundTruth(truth).match_batch(answers))
+        print(f"{size:>8} {'batch':>8} {legacy * 1000:>12.3f} {engine * 1000:>12.3f} {legacy / engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Micro-benchmark of the weight computation, from today's subnet size up to
+100k uids.
+
+Run from the repository root:
+
+    python benchmarks/bench_weights.py
+"""
+
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "subnet"))
+
+from utils.weights import WEIGHT_SCALE, compute_weights  # noqa: E402
+
+SIZES = [400, 1_000, 10_000, 100_000]
+MAX_ALLOWED_WEIGHTS = 400
+
+
+def legacy_weights(score_dict: dict[int, float], max_allowed_weights: int) -> tuple[list[int], list[int]]:
+    # the dict based implementation the validators used before utils.weights
+    sorted_scores = sorted(score_dict.items(), key=lambda x: x[1], reverse=True)
+    score_dict = dict(sorted_scores[:max_allowed_weights])
+    scores = sum(score_dict.values())
+    weighted_scores = {uid: int(score / scores * 10000) for uid, score in score_dict.items()}
+    weighted_scores = {k: v for k, v in weighted_scores.items() if v != 0}
+    return list(weighted_scores.keys()), list(weighted_scores.values())
+
+
+def bench(fn, score_dict: dict[int, float]) -> float:
+    timer = timeit.Timer(lambda: fn(score_dict, MAX_ALLOWED_WEIGHTS))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def check_extremes() -> None:
+    # the weights add up to the scale whatever the magnitude of the scores
+    for score_dict in ({1: 1e308, 2: 1e308}, {1: 1e-310, 2: 1e-310}, {1: 5e-324, 2: 1e308, 3: 1.0}):
+        uids, weights = compute_weights(score_dict, MAX_ALLOWED_WEIGHTS)
+        assert sum(weights) == WEIGHT_SCALE, (score_dict, uids, weights)
+
+
+def main() -> None:
+    check_extremes()
+    rng = random.Random(17)
+    print(f"{'uids':>8} {'legacy (ms)':>12} {'engine (ms)':>12} {'speedup':>8}")
+    for size in SIZES:
+        score_dict = {uid: rng.random() for uid in range(size)}
+        legacy = bench(legacy_weights, score_dict)
+        engine = bench(compute_weights, score_dict)
+        print(f"{size:>8} {legacy * 1000:>12.3f} {engine * 1000:>12.3f} {legacy / engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
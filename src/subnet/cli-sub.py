@@ -7,6 +7,7 @@ from communex.compat.key import classic_load_key  # type: ignore
 
 from subvalidator._config import ValidatorSettings
 from subvalidator.subvalidator import get_subnet_netuid, SubTwitterValidator
+from utils.logger import configure_logging
 
 app = typer.Typer()
 
@@ -17,10 +18,12 @@ def serve(
         ],
         call_timeout: int = 30,
 ):
+    configure_logging()
     keypair = classic_load_key(commune_key)  # type: ignore
     settings = ValidatorSettings()  # type: ignore
-    c_client = CommuneClient(get_node_url())
-    subnet_uid = get_subnet_netuid(c_client)
+    node_url = get_node_url()
+    c_client = CommuneClient(node_url)
+    subnet_uid = get_subnet_netuid(c_client, node_url=node_url)
     validator = SubTwitterValidator(
         keypair,
         subnet_uid,
@@ -7,6 +7,7 @@ from communex.compat.key import classic_load_key  # type: ignore
 
 from validator._config import ValidatorSettings
 from validator.validator import get_subnet_netuid, TwitterValidator
+from utils.logger import configure_logging
 
 app = typer.Typer()
 
@@ -17,16 +18,20 @@ def serve(
             str, typer.Argument(help="Name of the key present in `~/.commune/key`")
         ],
         call_timeout: int = 3,
+        hedge_requests: bool = False,
 ):
+    configure_logging()
     keypair = classic_load_key(commune_key)  # type: ignore
     settings = ValidatorSettings()  # type: ignore
-    c_client = CommuneClient(get_node_url())
-    subnet_uid = get_subnet_netuid(c_client)
+    node_url = get_node_url()
+    c_client = CommuneClient(node_url)
+    subnet_uid = get_subnet_netuid(c_client, node_url=node_url)
     validator = TwitterValidator(
         keypair,
         subnet_uid,
         c_client,
         call_timeout=call_timeout,
+        hedge_requests=hedge_requests,
     )
     validator.validation_loop(settings)
 
@@ -1,50 +1,356 @@
+import asyncio
+import concurrent.futures
+import math
 import os
-import requests
+import tempfile
+import threading
+import time
+import uuid
+from functools import partial
 
 from communex.module import Module, endpoint
 from communex.key import generate_keypair
 from keylimiter import TokenBucketLimiter
+from substrateinterface import Keypair  # type: ignore
+
+from ..utils.backend import BackendClient
+from ..utils.cache import TTLCache
+from ..utils.logger import configure_logging
+from ..utils.wire import encode_tweets
+from .prefetch import PREFETCH_PRIORITY, PrefetchWorker
+from .ratelimit import Priority, RateLimitExceeded, UpstreamScheduler
+from .shared import SharedBudget, SharedState
+from .store import TweetStore
+from .twitter import TwitterSearch
+
+DEFAULT_START_TIME = '2024-04-01T5:00:00Z'
+DEFAULT_MAX_RESULTS = 50
 
 
 class Miner(Module):
     def __init__(self):
         super().__init__()
         self.bearer_token = os.getenv('MC_BEARER_TOKEN')
+        self.cache = TTLCache(
+            maxsize=int(os.getenv('MC_CACHE_SIZE', 1024)),
+            ttl=float(os.getenv('MC_CACHE_TTL', 30)),
+        )
+        self.upstream_timeout = float(os.getenv('MC_UPSTREAM_TIMEOUT', 10))
+        # worker processes of one miner share their results and their rate limit budget through this file
+        shared_path = os.getenv('MC_SHARED_PATH')
+        self.shared = SharedState(shared_path, ttl=self.cache.ttl) if shared_path else None
+        # requests kept back in every rate limit window for validator queries, prefetches can't use them
+        self.scheduler = UpstreamScheduler(
+            reserve=int(os.getenv('MC_RATE_LIMIT_RESERVE', 0)),
+            budget=SharedBudget(self.shared) if self.shared else None,
+        )
+        self.twitter = TwitterSearch(self.bearer_token, timeout=self.upstream_timeout, scheduler=self.scheduler)
+        store_path = os.getenv('MC_STORE_PATH')
+        self.store = TweetStore(store_path) if store_path else None
+        self.store_max_age = float(os.getenv('MC_STORE_MAX_AGE', 60))
+
+        # every upstream call runs on this loop, so they all share one pooled client
+        self._upstream_loop = asyncio.new_event_loop()
+        self._prefetches: set[asyncio.Future] = set()
+        # the priority of every upstream search in flight, raised when a more urgent caller joins it
+        self._flight_priorities: dict[tuple, Priority] = {}
+        threading.Thread(target=self._upstream_loop.run_forever, name="miner-upstream", daemon=True).start()
+
+        # warm the cache with the queries validators are about to send
+        prefetch_interval = float(os.getenv('MC_PREFETCH_INTERVAL', 0))
+        subnet_url = os.getenv('MC_SUBNET_API_URL')
+        self.prefetcher = None
+        if prefetch_interval > 0 and subnet_url:
+            leader = None
+            if self.shared is not None:
+                # one worker polls the open requests for all of them, another takes over if it exits
+                owner = uuid.uuid4().hex
+                leader = partial(asyncio.to_thread, self.shared.hold, 'prefetch', owner, 3 * prefetch_interval)
+            self.prefetcher = PrefetchWorker(
+                BackendClient(subnet_url),
+                self._warm,
+                self.scheduler,
+                interval=prefetch_interval,
+                count=int(os.getenv('MC_PREFETCH_COUNT', 20)),
+                share=float(os.getenv('MC_PREFETCH_SHARE', 0.5)),
+                leader=leader,
+            )
+            asyncio.run_coroutine_threadsafe(self.prefetcher.run(), self._upstream_loop)
 
     @endpoint
-    def generate(self, prompt: str, start_time: str = '2024-04-01T5:00:00Z', max_results: int = 50):
-        # TODO: pass start_time, max_results from validator
-        url = "https://api.twitter.com/2/tweets/search/all"
+    def generate(
+            self,
+            prompt: str,
+            start_time: str = DEFAULT_START_TIME,
+            max_results: int = DEFAULT_MAX_RESULTS,
+            limit: int | None = None,
+            encoding: str | None = None,
+    ):
+        # validators only send `prompt` and get one page from the defaults; `start_time`, `max_results`,
+        # `limit` (following `next_token` up to that many tweets) and `generate_page` are for larger windows
+        # `encoding` is negotiated by validators (see utils.wire), the default answer stays plain JSON
+        pages = math.ceil(limit / max_results) if limit else 1
+        deadline = time.time() + self.upstream_timeout * pages
+        tweets = self._run_upstream(self._search(prompt, start_time, max_results, limit, deadline), pages)
+        return encode_tweets(tweets, encoding)
 
-        def bearer_oauth(r):
-            r.headers["Authorization"] = f"Bearer {self.bearer_token}"
-            r.headers["User-Agent"] = "v2FullArchiveSearchPython"
-            return r
+    @endpoint
+    async def agenerate(
+            self,
+            prompt: str,
+            start_time: str = DEFAULT_START_TIME,
+            max_results: int = DEFAULT_MAX_RESULTS,
+            limit: int | None = None,
+            encoding: str | None = None,
+    ):
+        # same answer as `generate`, without holding a server thread during the upstream call;
+        # cancelling this call (e.g. when the validator disconnects) cancels the upstream request
+        pages = math.ceil(limit / max_results) if limit else 1
+        deadline = time.time() + self.upstream_timeout * pages
+        tweets = await self._await_upstream(self._search(prompt, start_time, max_results, limit, deadline))
+        return encode_tweets(tweets, encoding)
 
-        response = requests.request("GET", url, auth=bearer_oauth, params={
-            'query': prompt,
-            "max_results": max_results,
-            "start_time": start_time,
-            "user.fields": "id,username,name",
-            "tweet.fields": "created_at,author_id"
-        })
+    @endpoint
+    def generate_page(
+            self,
+            prompt: str,
+            start_time: str = DEFAULT_START_TIME,
+            max_results: int = DEFAULT_MAX_RESULTS,
+            cursor: str | None = None,
+    ):
+        # streaming mode: returns {"data": [...], "next_cursor": ...}, pass `next_cursor` back for the next chunk
+        deadline = time.time() + self.upstream_timeout
+        return self._run_upstream(self._page(prompt, start_time, max_results, cursor, deadline))
 
-        if response.ok:
-            tweets = response.json()
-            return tweets['data']
-        raise Exception(f"Cant get tweets for prompt '{prompt}'")
+    @endpoint
+    async def agenerate_page(
+            self,
+            prompt: str,
+            start_time: str = DEFAULT_START_TIME,
+            max_results: int = DEFAULT_MAX_RESULTS,
+            cursor: str | None = None,
+    ):
+        deadline = time.time() + self.upstream_timeout
+        return await self._await_upstream(self._page(prompt, start_time, max_results, cursor, deadline))
 
+    def _run_upstream(self, coro, pages: int = 1):
+        future = asyncio.run_coroutine_threadsafe(coro, self._upstream_loop)
+        try:
+            return future.result(timeout=self.upstream_timeout * pages)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise Exception("Cant get tweets in time")
 
-if __name__ == "__main__":
+    async def _await_upstream(self, coro):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._upstream_loop))
+
+    async def _search(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            limit: int | None = None,
+            deadline: float | None = None,
+            priority: int = 0,
+    ):
+        # validators often send the same prompt within seconds, answer those from the cache
+        if limit is None or limit <= max_results:
+            key = (prompt, start_time, max_results)
+            tweets = await self._flight(
+                key,
+                priority,
+                lambda flight_priority: self._shared(
+                    key,
+                    lambda: self._search_page(prompt, start_time, max_results, deadline, flight_priority),
+                ),
+            )
+            return tweets if limit is None else tweets[:limit]
+
+        key = (prompt, start_time, max_results, limit)
+        return await self.cache.aget_or_compute(
+            key,
+            lambda: self._shared(
+                key,
+                lambda: self._collect_pages(prompt, start_time, max_results, limit, deadline),
+                pages=math.ceil(limit / max_results),
+            ),
+        )
+
+    async def _flight(self, key: tuple, priority: int, compute):
+        # a validator query joining a prefetch that still waits for budget must not wait behind it
+        flight_priority = self._flight_priorities.get(key)
+        if flight_priority is not None:
+            self.scheduler.promote(flight_priority, priority)
+            return await self.cache.aget_or_compute(key, lambda: compute(flight_priority))
+
+        flight_priority = self._flight_priorities[key] = Priority(priority)
+        try:
+            return await self.cache.aget_or_compute(key, lambda: compute(flight_priority))
+        finally:
+            if self._flight_priorities.get(key) is flight_priority:
+                del self._flight_priorities[key]
+
+    async def _shared(self, key: tuple, compute, pages: int = 1):
+        # with several workers, only one of them searches upstream and the others pick up its answer
+        if self.shared is None:
+            return await compute()
+        return await self.shared.aget_or_compute(key, compute, lease=self.upstream_timeout * pages)
+
+    async def _search_page(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            deadline: float | None = None,
+            priority: int | Priority = 0,
+    ):
+        if self.store is None:
+            return await self.twitter.search(prompt, start_time, max_results, deadline, priority)
+
+        try:
+            return await self._sync_page(prompt, start_time, max_results, deadline, priority)
+        except RateLimitExceeded:
+            # out of upstream budget: an outdated answer still beats no answer
+            tweets = await asyncio.to_thread(self.store.lookup, prompt, start_time, max_results, math.inf)
+            if tweets is None:
+                raise
+            return tweets
+
+    async def _sync_page(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            deadline: float | None,
+            priority: int | Priority,
+    ):
+        tweets = await asyncio.to_thread(self.store.lookup, prompt, start_time, max_results, self.store_max_age)
+        if tweets is not None:
+            return tweets
+
+        # only ask upstream for what is newer than the stored results
+        since_id = await asyncio.to_thread(self.store.sync_point, prompt, start_time)
+        if since_id is not None:
+            page = await self.twitter.fetch_page(
+                prompt, start_time, max_results, since_id=since_id, priority=priority, deadline=deadline
+            )
+            await asyncio.to_thread(self.store.save, prompt, start_time, page.get('data', []), max_results, since_id)
+            tweets = await asyncio.to_thread(self.store.lookup, prompt, start_time, max_results, self.store_max_age)
+            if tweets is not None:
+                return tweets
+
+        page = await self.twitter.fetch_page(
+            prompt, start_time, max_results, priority=priority, deadline=deadline
+        )
+        await asyncio.to_thread(self.store.save, prompt, start_time, page.get('data', []), max_results)
+        return page['data']
+
+    async def _warm(self, prompt: str):
+        # same cache key as a validator `generate` call with the default parameters
+        return await self._search(
+            prompt,
+            DEFAULT_START_TIME,
+            DEFAULT_MAX_RESULTS,
+            deadline=time.time() + self.upstream_timeout,
+            priority=PREFETCH_PRIORITY,
+        )
+
+    async def _collect_pages(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            limit: int,
+            deadline: float | None = None,
+    ):
+        tweets = []
+        async for page in self.twitter.iter_pages(prompt, start_time, max_results, limit, deadline):
+            tweets.extend(page)
+        return tweets
+
+    async def _page(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            cursor: str | None,
+            deadline: float | None = None,
+    ):
+        page = await self._cached_page(prompt, start_time, max_results, cursor, deadline=deadline)
+        next_cursor = page.get('meta', {}).get('next_token')
+        if next_cursor:
+            # fetch the next chunk while the validator handles this one, behind any validator query
+            prefetch = asyncio.ensure_future(
+                self._cached_page(
+                    prompt, start_time, max_results, next_cursor,
+                    priority=PREFETCH_PRIORITY, deadline=time.time() + self.upstream_timeout,
+                )
+            )
+            self._prefetches.add(prefetch)
+            prefetch.add_done_callback(self._prefetch_done)
+        return {"data": page.get('data', []), "next_cursor": next_cursor}
+
+    async def _cached_page(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            cursor: str | None,
+            priority: int = 0,
+            deadline: float | None = None,
+    ):
+        key = ("page", prompt, start_time, max_results, cursor)
+        return await self._flight(
+            key,
+            priority,
+            lambda flight_priority: self._shared(
+                key,
+                lambda: self.twitter.fetch_page(
+                    prompt, start_time, max_results, cursor, priority=flight_priority, deadline=deadline
+                ),
+            ),
+        )
+
+    def _prefetch_done(self, prefetch: asyncio.Future) -> None:
+        self._prefetches.discard(prefetch)
+        if not prefetch.cancelled():
+            # a failed prefetch is retried when the page is actually requested
+            prefetch.exception()
+
+
+def create_app():
     from communex.module.server import ModuleServer
-    import uvicorn
 
-    key = generate_keypair()
+    configure_logging()
     miner = Miner()
+    # every worker process serves under the key the launcher passes them
+    mnemonic = os.getenv('MC_KEY_MNEMONIC')
+    key = Keypair.create_from_mnemonic(mnemonic) if mnemonic else generate_keypair()
     refill_rate = 1 / 400
     bucket = TokenBucketLimiter(2, refill_rate)
     server = ModuleServer(miner, key, ip_limiter=bucket, subnets_whitelist=[17])
-    app = server.get_fastapi_app()
+    return server.get_fastapi_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
 
     # Only allow local connections
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # keep idle validator connections open across their validation steps
+    workers = int(os.getenv('MC_WORKERS', 1))
+    if workers > 1:
+        # every worker process builds its own app, they share results and rate limit budget through one file,
+        # by default in a directory only this user can enter, removed on exit
+        with tempfile.TemporaryDirectory(prefix='market-compass-miner-') as shared_dir:
+            os.environ.setdefault('MC_SHARED_PATH', os.path.join(shared_dir, 'shared.db'))
+            os.environ.setdefault('MC_KEY_MNEMONIC', Keypair.generate_mnemonic())
+            uvicorn.run(
+                "subnet.miner.model:create_app",
+                factory=True,
+                workers=workers,
+                host="0.0.0.0",
+                port=8000,
+                timeout_keep_alive=120,
+            )
+    else:
+        uvicorn.run(create_app(), host="0.0.0.0", port=8000, timeout_keep_alive=120)
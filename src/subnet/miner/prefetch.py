@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from ..utils.backend import BackendClient
+from ..utils.logger import get_logger
+from .ratelimit import RateLimitExceeded, UpstreamScheduler
+
+logger = get_logger(__name__)
+
+PREFETCH_PRIORITY = 1
+
+
+class PrefetchWorker:
+    """
+    Warms the miner cache with the queries validators are about to send.
+
+    Every `interval` seconds the open request queue of the backend is
+    polled and each query in it is searched ahead of time through `warm`,
+    one at a time and at a lower priority than validator queries.
+    Prefetching stops for the rest of the rate limit window once less than
+    `1 - share` of the window is left, so it never eats into the budget kept
+    for validators. With `leader`, only steps for which it returns True
+    prefetch, so that one worker of a multi-process miner polls for all.
+    """
+
+    def __init__(
+            self,
+            backend: BackendClient,
+            warm: Callable[[str], Awaitable[object]],
+            scheduler: UpstreamScheduler,
+            interval: float = 10,
+            count: int = 20,
+            share: float = 0.5,
+            leader: Callable[[], Awaitable[bool]] | None = None,
+    ) -> None:
+        self.backend = backend
+        self.warm = warm
+        self.scheduler = scheduler
+        self.interval = interval
+        self.count = count
+        self.share = share
+        self.leader = leader
+
+    def has_budget(self) -> bool:
+        remaining, limit = self.scheduler.remaining, self.scheduler.limit
+        if remaining is None or not limit:
+            return True
+        return remaining > limit * (1 - self.share)
+
+    async def run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                await self.step()
+            except Exception as e:
+                logger.warning("Prefetch failed: %s", e)
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+    async def step(self) -> int:
+        """
+        Prefetch the queries currently in the open request queue.
+
+        Returns:
+            The number of queries warmed.
+        """
+
+        if self.leader is not None and not await self.leader():
+            return 0
+        if not self.has_budget():
+            return 0
+        response = await self.backend.request(
+            'GET', '/subnet/getNextOpenRequests', params={'count': self.count}
+        )
+        if not response.ok:
+            raise Exception("cant get open requests")
+
+        warmed = 0
+        for request in response.json():
+            if not self.has_budget():
+                break
+            try:
+                await self.warm(request['query'])
+            except RateLimitExceeded:
+                break
+            except Exception as e:
+                logger.warning("Prefetch of '%s' failed: %s", request.get('query'), e)
+                continue
+            warmed += 1
+        return warmed
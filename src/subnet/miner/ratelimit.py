@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Mapping
+
+import httpx
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class Priority:
+    """
+    A call priority that can still be raised while the call waits.
+
+    Calls that share one upstream request, e.g. a prefetch joined by a
+    validator query, share one `Priority` and `UpstreamScheduler.promote`
+    it to the most urgent of them.
+    """
+
+    def __init__(self, value: int = 0) -> None:
+        self.value = value
+
+
+class Budget:
+    """
+    The rate limit window as seen by one process.
+
+    `SharedBudget` keeps the same state in a file, for miners serving from
+    several processes with one API quota.
+    """
+
+    def __init__(self) -> None:
+        self.remaining: int | None = None
+        self.limit: int | None = None
+        self.reset_at = 0.0
+
+    def window(self, now: float) -> tuple[int | None, int | None, float]:
+        """The requests left, the window size and the reset time, if known."""
+
+        remaining = self.remaining if now < self.reset_at else None
+        return remaining, self.limit, self.reset_at
+
+    def take(self, floor: int, now: float) -> bool:
+        """Spend one request unless no more than `floor` are left."""
+
+        if self.remaining is None or now >= self.reset_at:
+            return True
+        if self.remaining <= floor:
+            return False
+        self.remaining -= 1
+        return True
+
+    def give_back(self, now: float) -> None:
+        if self.remaining is not None and now < self.reset_at:
+            self.remaining += 1
+
+    def observe(self, remaining: int, limit: int | None, reset_at: float, in_flight: int) -> None:
+        if limit is not None:
+            self.limit = limit
+        if reset_at != self.reset_at or self.remaining is None:
+            # a new window: calls still in flight are not counted by upstream yet
+            self.remaining = remaining - in_flight
+            self.reset_at = reset_at
+        else:
+            self.remaining = min(self.remaining, remaining)
+
+    def exhaust(self) -> None:
+        self.remaining = 0
+
+
+class UpstreamScheduler:
+    """
+    Outbound scheduler that spends the Twitter API quota deliberately.
+
+    The budget comes from the `x-rate-limit-remaining` and
+    `x-rate-limit-reset` headers of every response. While it lasts, calls go
+    out right away, at most `max_in_flight` at a time. Once it is spent,
+    calls wait in a queue ordered by priority (lower first) and then by
+    deadline, and are released when the window resets. A call whose
+    deadline falls before the reset fails fast with `RateLimitExceeded`
+    instead of burning a request on a 429. `reserve` requests of every
+    window are kept for priority 0 calls.
+
+    It must be used from a single event loop. Schedulers in several
+    processes share one quota through a shared `budget`.
+    """
+
+    def __init__(
+            self,
+            max_in_flight: int = 8,
+            reserve: int = 0,
+            clock: Callable[[], float] = time.time,
+            budget: Budget | None = None,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.reserve = reserve
+        self.clock = clock
+        self.budget = budget or Budget()
+        self._in_flight = 0
+        self._queue: list[tuple[int, float, int, asyncio.Future, Priority | None]] = []
+        self._order = itertools.count()
+        self._reset_timer: asyncio.TimerHandle | None = None
+
+    @property
+    def remaining(self) -> int | None:
+        """Requests left in the current window, or None when unknown."""
+
+        return self.budget.window(self.clock())[0]
+
+    @property
+    def limit(self) -> int | None:
+        """Requests allowed per window, or None when unknown."""
+
+        return self.budget.window(self.clock())[1]
+
+    async def submit(
+            self,
+            call: Callable[[], Awaitable[httpx.Response]],
+            priority: int | Priority = 0,
+            deadline: float | None = None,
+    ) -> httpx.Response:
+        """
+        Run an upstream call within the rate limit budget.
+
+        Args:
+            call: Coroutine function sending the request.
+            priority: Lower runs first; anything above 0 cannot use the reserve.
+                A `Priority` can be promoted while the call waits.
+            deadline: Wall clock time after which the answer is useless.
+
+        Returns:
+            The upstream response.
+
+        Raises:
+            RateLimitExceeded: If the call cannot be sent before its deadline,
+                or upstream answered 429.
+        """
+
+        await self._acquire(priority, deadline)
+        try:
+            response = await call()
+        finally:
+            self._in_flight -= 1
+            self._dispatch()
+
+        self._update(response.headers)
+        if response.status_code == 429:
+            self.budget.exhaust()
+            self._schedule_reset()
+            raise RateLimitExceeded("Twitter API rate limit reached")
+        return response
+
+    def promote(self, priority: Priority, value: int) -> None:
+        """Raise `priority` to `value`, moving its waiting calls up the queue."""
+
+        if value >= priority.value:
+            return
+        priority.value = value
+        if any(entry[4] is priority for entry in self._queue):
+            self._queue = [
+                (value, *entry[1:]) if entry[4] is priority else entry for entry in self._queue
+            ]
+            heapq.heapify(self._queue)
+            self._dispatch()
+
+    async def _acquire(self, handle: int | Priority, deadline: float | None) -> None:
+        priority = handle.value if isinstance(handle, Priority) else handle
+        if not self._queue and self._try_take(priority):
+            return
+
+        remaining, _, reset_at = self.budget.window(self.clock())
+        if deadline is not None and remaining == 0 and reset_at > deadline:
+            raise RateLimitExceeded("Twitter API budget is spent until after the deadline")
+
+        ticket = asyncio.get_running_loop().create_future()
+        entry = (
+            priority,
+            deadline if deadline is not None else float("inf"),
+            next(self._order),
+            ticket,
+            handle if isinstance(handle, Priority) else None,
+        )
+        heapq.heappush(self._queue, entry)
+        self._schedule_reset()
+        timeout = None if deadline is None else max(deadline - self.clock(), 0)
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.done():
+                # granted just as the caller gave up, hand the slot back
+                self._release()
+            else:
+                ticket.cancel()
+                # the entry may have been rebuilt by a promotion
+                self._queue = [queued for queued in self._queue if queued[3] is not ticket]
+                heapq.heapify(self._queue)
+            if isinstance(e, asyncio.TimeoutError):
+                raise RateLimitExceeded("Twitter API budget did not free up before the deadline")
+            raise
+
+    def _try_take(self, priority: int) -> bool:
+        if self._in_flight >= self.max_in_flight:
+            return False
+        floor = 0 if priority <= 0 else self.reserve
+        if not self.budget.take(floor, self.clock()):
+            return False
+        self._in_flight += 1
+        return True
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self.budget.give_back(self.clock())
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queue:
+            priority, _, _, ticket, _ = self._queue[0]
+            if ticket.done():
+                heapq.heappop(self._queue)
+                continue
+            if not self._try_take(priority):
+                break
+            heapq.heappop(self._queue)
+            ticket.set_result(None)
+        if self._queue:
+            self._schedule_reset()
+
+    def _update(self, headers: Mapping[str, str]) -> None:
+        try:
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset_at = float(headers["x-rate-limit-reset"])
+        except (KeyError, ValueError):
+            return
+        limit = headers.get("x-rate-limit-limit", "")
+        self.budget.observe(remaining, int(limit) if limit.isdigit() else None, reset_at, self._in_flight)
+
+    def _schedule_reset(self) -> None:
+        remaining, _, reset_at = self.budget.window(self.clock())
+        if self._reset_timer is not None or remaining is None:
+            return
+        delay = max(reset_at - self.clock(), 0)
+        self._reset_timer = asyncio.get_running_loop().call_later(delay, self._on_reset)
+
+    def _on_reset(self) -> None:
+        self._reset_timer = None
+        self._dispatch()
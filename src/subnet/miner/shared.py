@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from .ratelimit import Budget
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS budget (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    remaining INTEGER,
+    window_limit INTEGER,
+    reset_at REAL NOT NULL
+);
+INSERT OR IGNORE INTO budget (id, remaining, window_limit, reset_at) VALUES (1, NULL, NULL, 0);
+CREATE TABLE IF NOT EXISTS roles (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+_MISSING = object()
+
+
+class SharedState:
+    """
+    SQLite file shared by the worker processes of one miner.
+
+    It holds the search results every worker can answer from, short leases
+    so that only one worker at a time computes a given result, roles that
+    only one worker plays, and the Twitter API rate limit window. Each
+    process opens its own connection.
+
+    The file is only readable and writable by its owner, since workers
+    serve what it holds to validators. A file of another user is refused.
+    """
+
+    def __init__(self, path: str, ttl: float = 30, poll_interval: float = 0.05) -> None:
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        # sqlite gives the journal files the permissions of the database file
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        try:
+            if hasattr(os, "fchmod"):
+                os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ? AND expires_at > ?", (_encode_key(key), time.time())
+            ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key: Hashable, value: Any) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, expires_at, value) VALUES (?, ?, ?)",
+                (_encode_key(key), now + self.ttl, json.dumps(value)),
+            )
+            self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+
+    async def aget_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], lease: float) -> Any:
+        """
+        Return the shared result for `key`, computing it in one worker only.
+
+        The worker that takes the lease computes and publishes the result,
+        the others poll for it until the lease runs out and then compute it
+        themselves. Failures are not shared.
+
+        Args:
+            key: The cache key.
+            compute: Coroutine function producing a missing value.
+            lease: How long, in seconds, the computation may take.
+
+        Returns:
+            The shared or freshly computed value.
+        """
+
+        encoded = _encode_key(key)
+        while True:
+            value = await asyncio.to_thread(self.get, key, _MISSING)
+            if value is not _MISSING:
+                return value
+            if await asyncio.to_thread(self._take_lease, encoded, lease):
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            value = await compute()
+            await asyncio.to_thread(self.set, key, value)
+        finally:
+            await asyncio.to_thread(self._drop_lease, encoded)
+        return value
+
+    def hold(self, role: str, owner: str, ttl: float) -> bool:
+        """
+        Take or renew `role` for `owner`.
+
+        Only one owner holds a role at a time. It is free again once its
+        owner did not renew it for `ttl` seconds, e.g. because it exited.
+
+        Returns:
+            Whether `owner` holds the role.
+        """
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT owner, expires_at FROM roles WHERE name = ?", (role,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO roles (name, owner, expires_at) VALUES (?, ?, ?)", (role, owner, now + ttl)
+            )
+            return True
+
+    def _take_lease(self, key: str, lease: float) -> bool:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + lease)
+            )
+            return True
+
+    def _drop_lease(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ?", (key,))
+
+
+class SharedBudget(Budget):
+    """
+    `Budget` kept in a `SharedState`, so every worker spends the same quota.
+
+    The scheduler runs on the event loop, so this budget never touches the
+    file from its methods: they act on an in-process copy of the window,
+    and a background thread writes every change to the file and reads the
+    window back after each change and every `sync_interval` seconds. Other
+    workers' spending shows up with that delay; the rare request spent
+    twice in between is caught by the 429 handling of the scheduler.
+    """
+
+    def __init__(self, state: SharedState, sync_interval: float = 0.1) -> None:
+        super().__init__()
+        self.state = state
+        self.sync_interval = sync_interval
+        self._changes: queue.SimpleQueue[tuple] = queue.SimpleQueue()
+        self._read()
+        threading.Thread(target=self._sync_forever, name="miner-budget-sync", daemon=True).start()
+
+    def take(self, floor: int, now: float) -> bool:
+        taken = super().take(floor, now)
+        if taken:
+            self._changes.put(("take", floor, now))
+        return taken
+
+    def give_back(self, now: float) -> None:
+        super().give_back(now)
+        self._changes.put(("give_back", now))
+
+    def observe(self, remaining: int, limit: int | None, reset_at: float, in_flight: int) -> None:
+        super().observe(remaining, limit, reset_at, in_flight)
+        self._changes.put(("observe", remaining, limit, reset_at, in_flight))
+
+    def exhaust(self) -> None:
+        super().exhaust()
+        self._changes.put(("exhaust",))
+
+    def _sync_forever(self) -> None:
+        while True:
+            try:
+                change = self._changes.get(timeout=self.sync_interval)
+            except queue.Empty:
+                change = None
+            try:
+                if change is not None:
+                    getattr(self, f"_write_{change[0]}")(*change[1:])
+                self._read()
+            except sqlite3.Error:
+                # the file is busy or gone for now, the local copy carries on until the next sync
+                continue
+
+    def _read(self) -> None:
+        with self.state._lock:
+            self.remaining, self.limit, self.reset_at = self.state._conn.execute(
+                "SELECT remaining, window_limit, reset_at FROM budget WHERE id = 1"
+            ).fetchone()
+
+    def _write_take(self, floor: int, now: float) -> None:
+        with self.state._lock:
+            self.state._conn.execute(
+                "UPDATE budget SET remaining = remaining - 1"
+                " WHERE id = 1 AND remaining IS NOT NULL AND reset_at > ? AND remaining > ?",
+                (now, floor),
+            )
+
+    def _write_give_back(self, now: float) -> None:
+        with self.state._lock:
+            self.state._conn.execute(
+                "UPDATE budget SET remaining = remaining + 1"
+                " WHERE id = 1 AND remaining IS NOT NULL AND reset_at > ?",
+                (now,),
+            )
+
+    def _write_observe(self, remaining: int, limit: int | None, reset_at: float, in_flight: int) -> None:
+        with self.state._lock, self.state._conn:
+            self.state._conn.execute("BEGIN IMMEDIATE")
+            known_remaining, known_limit, known_reset_at = self.state._conn.execute(
+                "SELECT remaining, window_limit, reset_at FROM budget WHERE id = 1"
+            ).fetchone()
+            if reset_at != known_reset_at or known_remaining is None:
+                # a new window: calls still in flight are not counted by upstream yet
+                known_remaining, known_reset_at = remaining - in_flight, reset_at
+            else:
+                known_remaining = min(known_remaining, remaining)
+            self.state._conn.execute(
+                "UPDATE budget SET remaining = ?, window_limit = ?, reset_at = ? WHERE id = 1",
+                (known_remaining, limit if limit is not None else known_limit, known_reset_at),
+            )
+
+    def _write_exhaust(self) -> None:
+        with self.state._lock:
+            self.state._conn.execute("UPDATE budget SET remaining = 0 WHERE id = 1")
+
+
+def _encode_key(key: Hashable) -> str:
+    return json.dumps(key)
@@ -0,0 +1,167 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tweets (
+    id TEXT PRIMARY KEY,
+    created_ms INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS query_tweets (
+    query TEXT NOT NULL,
+    tweet_id TEXT NOT NULL,
+    created_ms INTEGER NOT NULL,
+    PRIMARY KEY (query, tweet_id)
+);
+CREATE INDEX IF NOT EXISTS query_tweets_by_time ON query_tweets (query, created_ms DESC);
+CREATE TABLE IF NOT EXISTS coverage (
+    query TEXT PRIMARY KEY,
+    start_ms INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    complete INTEGER NOT NULL,
+    newest_id TEXT
+);
+"""
+
+
+def to_ms(timestamp: str) -> int:
+    """Parse a Twitter timestamp (`2024-04-01T05:00:00.000Z` or `2024-04-01T5:00:00Z`)."""
+
+    for fmt in ("%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            parsed = datetime.strptime(timestamp, fmt).replace(tzinfo=timezone.utc)
+            return int(parsed.timestamp() * 1000)
+        except ValueError:
+            continue
+    raise ValueError(f"Unknown timestamp format: {timestamp}")
+
+
+class TweetStore:
+    """
+    On-disk store of the search results a miner already fetched.
+
+    Every query keeps an index of the tweets it returned, plus a coverage
+    record: the start time it was searched from, when it was last synced and
+    whether the upstream answer was complete (fewer tweets than a full
+    page). A request is answered locally only when that coverage provably
+    yields the same newest tweets the upstream search would return, so the
+    store never changes what a miner answers, only how fast.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def lookup(self, query: str, start_time: str, max_results: int, max_age: float) -> list[dict] | None:
+        """
+        Answer a search from the store.
+
+        Args:
+            query: The search query.
+            start_time: The oldest tweet time requested.
+            max_results: The number of tweets requested.
+            max_age: How old, in seconds, the last sync may be.
+
+        Returns:
+            The newest matching tweets, or None when the store cannot answer.
+        """
+
+        start_ms = to_ms(start_time)
+        with self._lock:
+            coverage = self._coverage(query)
+            if coverage is None:
+                return None
+            covered_start_ms, synced_at, complete, _ = coverage
+            if covered_start_ms > start_ms or time.time() - synced_at > max_age:
+                return None
+            rows = self._conn.execute(
+                "SELECT t.payload FROM query_tweets q JOIN tweets t ON t.id = q.tweet_id"
+                " WHERE q.query = ? AND q.created_ms >= ?"
+                " ORDER BY q.created_ms DESC, q.tweet_id DESC LIMIT ?",
+                (query, start_ms, max_results),
+            ).fetchall()
+        if len(rows) < max_results and not complete:
+            # older matching tweets may exist upstream beyond what was stored
+            return None
+        return [json.loads(payload) for payload, in rows]
+
+    def sync_point(self, query: str, start_time: str) -> str | None:
+        """
+        The newest stored tweet id to sync `query` from incrementally.
+
+        Returns:
+            The id to pass as `since_id`, or None if a full search is needed.
+        """
+
+        with self._lock:
+            coverage = self._coverage(query)
+        if coverage is None or coverage[0] > to_ms(start_time):
+            return None
+        return coverage[3]
+
+    def save(
+            self,
+            query: str,
+            start_time: str,
+            tweets: list[dict],
+            max_results: int,
+            since_id: str | None = None,
+    ) -> None:
+        """
+        Record an upstream answer.
+
+        Args:
+            query: The search query.
+            start_time: The start time the search used.
+            tweets: The tweets the upstream search returned, newest first.
+            max_results: The page size of the search.
+            since_id: The `since_id` of an incremental sync, if it was one.
+        """
+
+        full_page = len(tweets) >= max_results
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            coverage = self._coverage(query)
+            incremental = since_id is not None and coverage is not None and not full_page
+            if not incremental:
+                # a fresh search, or a sync that may have skipped tweets: restart the index
+                self._conn.execute("DELETE FROM query_tweets WHERE query = ?", (query,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tweets (id, created_ms, payload) VALUES (?, ?, ?)",
+                [(t['id'], to_ms(t['created_at']), json.dumps(t)) for t in tweets],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO query_tweets (query, tweet_id, created_ms) VALUES (?, ?, ?)",
+                [(query, t['id'], to_ms(t['created_at'])) for t in tweets],
+            )
+            if incremental:
+                covered_start_ms, _, complete, newest_id = coverage
+                newest_id = tweets[0]['id'] if tweets else newest_id
+            else:
+                covered_start_ms = to_ms(start_time)
+                complete = not full_page
+                newest_id = tweets[0]['id'] if tweets else None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO coverage (query, start_ms, synced_at, complete, newest_id)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (query, covered_start_ms, time.time(), int(complete), newest_id),
+            )
+
+    def _coverage(self, query: str) -> tuple[int, float, bool, str | None] | None:
+        row = self._conn.execute(
+            "SELECT start_ms, synced_at, complete, newest_id FROM coverage WHERE query = ?", (query,)
+        ).fetchone()
+        if row is None:
+            return None
+        start_ms, synced_at, complete, newest_id = row
+        return start_ms, synced_at, bool(complete), newest_id
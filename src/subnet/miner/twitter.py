@@ -0,0 +1,153 @@
+import asyncio
+import importlib.util
+from typing import AsyncIterator
+
+import httpx
+
+from .ratelimit import Priority, UpstreamScheduler
+
+SEARCH_ALL_URL = "https://api.twitter.com/2/tweets/search/all"
+
+# HTTP/2 needs the optional `h2` package (`pip install httpx[http2]`)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class TwitterSearch:
+    """
+    Full-archive search over one long-lived pooled HTTP client.
+
+    The client is created lazily on the event loop that first uses it and
+    must stay on that loop. Connections to api.twitter.com are kept alive
+    and reused, over HTTP/2 when available. Every request goes through
+    `scheduler`, which keeps the search within the API rate limit.
+    """
+
+    def __init__(
+            self,
+            bearer_token: str | None,
+            timeout: float = 10,
+            max_connections: int = 20,
+            scheduler: UpstreamScheduler | None = None,
+    ) -> None:
+        self.bearer_token = bearer_token
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.scheduler = scheduler or UpstreamScheduler(max_in_flight=max_connections)
+        self._client: httpx.AsyncClient | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=120,
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.bearer_token}",
+                    "User-Agent": "v2FullArchiveSearchPython",
+                },
+            )
+        return self._client
+
+    async def fetch_page(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            next_token: str | None = None,
+            since_id: str | None = None,
+            priority: int | Priority = 0,
+            deadline: float | None = None,
+    ) -> dict:
+        """
+        Fetch one page of search results.
+
+        `since_id` restricts the page to tweets newer than that id.
+        `priority` and `deadline` are handed to the scheduler, see
+        `UpstreamScheduler.submit`.
+
+        Returns:
+            The raw page, with the tweets under `data` and the token of the
+            next page, if any, under `meta.next_token`.
+        """
+
+        params = {
+            'query': prompt,
+            "max_results": max_results,
+            "start_time": start_time,
+            "user.fields": "id,username,name",
+            "tweet.fields": "created_at,author_id"
+        }
+        if next_token:
+            params["next_token"] = next_token
+        if since_id:
+            params["since_id"] = since_id
+
+        client = self._get_client()
+        response = await self.scheduler.submit(
+            lambda: client.get(SEARCH_ALL_URL, params=params), priority, deadline
+        )
+        if response.is_success:
+            return response.json()
+        raise Exception(f"Cant get tweets for prompt '{prompt}'")
+
+    async def search(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            deadline: float | None = None,
+            priority: int | Priority = 0,
+    ) -> list[dict]:
+        page = await self.fetch_page(prompt, start_time, max_results, priority=priority, deadline=deadline)
+        return page['data']
+
+    async def iter_pages(
+            self,
+            prompt: str,
+            start_time: str,
+            max_results: int,
+            limit: int,
+            deadline: float | None = None,
+    ) -> AsyncIterator[list[dict]]:
+        """
+        Follow `next_token` and yield the tweets page by page.
+
+        The next page is requested before the current one is yielded, so
+        the upstream round trip overlaps with whatever the caller does with
+        the page. At most two pages are held in memory.
+
+        Args:
+            prompt: The search query.
+            start_time: The oldest tweet time to return.
+            max_results: The page size.
+            limit: Stop after this many tweets.
+            deadline: Wall clock time by which every page must be requested.
+        """
+
+        fetched = 0
+        next_page = asyncio.ensure_future(self.fetch_page(prompt, start_time, max_results, deadline=deadline))
+        try:
+            while next_page is not None:
+                page = await next_page
+                next_page = None
+                tweets = page.get('data', [])[:limit - fetched]
+                fetched += len(tweets)
+                next_token = page.get('meta', {}).get('next_token')
+                if next_token and fetched < limit:
+                    next_page = asyncio.ensure_future(
+                        self.fetch_page(prompt, start_time, max_results, next_token, deadline=deadline)
+                    )
+                if tweets:
+                    yield tweets
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -4,3 +4,13 @@ class ValidatorSettings(BaseSettings):
     subnet_name: str = 'market-compass'
     iteration_interval: int = 60  # Set, accordingly to your tempo.
     max_allowed_weights: int = 400  # Query dynamically based on your subnet settings.
+    max_concurrent_queries: int = 256  # Upper bound on miner calls in flight at once.
+    max_concurrent_scoring: int = 32  # Upper bound on miner answer checks in flight at once.
+    latency_stats_path: str | None = None  # Where to write per-miner latency percentiles each step.
+    ground_truth_ttl: float = 30  # Seconds a Twitter search is reused to check other miners with the same prompt.
+    ground_truth_cache_size: int = 256  # Upper bound on cached Twitter searches.
+    spot_check_budget: int = 6  # Twitter API checks of miner answers allowed per spot_check_window.
+    spot_check_window: float = 60  # Seconds over which spot_check_budget is spent.
+    reputation_path: str | None = None  # Log file keeping spot check history and blacklist across restarts.
+    blacklist_ttl: float = 86400  # Seconds a miner that failed a spot check stays blacklisted.
+    verification_workers: int = 2  # Spot checks running in the background at once.
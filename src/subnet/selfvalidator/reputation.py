@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+
+@dataclass
+class Reputation:
+    last_checked: float | None = None
+    checks: int = 0
+    failures: int = 0
+    blacklisted_until: float | None = None
+
+
+class ReputationStore:
+    """
+    Spot check history of every miner, kept across restarts.
+
+    Lookups and updates only touch an in-memory dict. Changed entries are
+    appended to a JSON lines log by `flush`, which is meant to run off the
+    validation path; entries changed several times between flushes are
+    written once. On startup the log is replayed, the last line of a miner
+    wins, and entries with nothing left worth keeping are dropped. The log
+    is compacted once it holds mostly superseded lines.
+
+    Blacklisting expires after `blacklist_ttl` seconds. A miner that was not
+    checked for `retention` seconds is forgotten.
+    """
+
+    def __init__(
+            self,
+            path: str | None = None,
+            blacklist_ttl: float = 86400,
+            retention: float = 7 * 86400,
+            clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path
+        self.blacklist_ttl = blacklist_ttl
+        self.retention = retention
+        self.clock = clock
+        self._entries: dict[str, Reputation] = {}
+        self._dirty: set[str] = set()
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        if path is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, miner: str) -> Reputation | None:
+        return self._entries.get(miner)
+
+    def is_blacklisted(self, miner: str) -> bool:
+        entry = self._entries.get(miner)
+        return entry is not None and entry.blacklisted_until is not None and entry.blacklisted_until > self.clock()
+
+    def touch(self, miner: str) -> None:
+        """Record that `miner` is being checked now."""
+
+        with self._lock:
+            self._entry(miner).last_checked = self.clock()
+            self._dirty.add(miner)
+
+    def record_check(self, miner: str, passed: bool) -> None:
+        """Record the outcome of a check, blacklisting the miner if it failed."""
+
+        now = self.clock()
+        with self._lock:
+            entry = self._entry(miner)
+            entry.last_checked = now
+            entry.checks += 1
+            if not passed:
+                entry.failures += 1
+                entry.blacklisted_until = now + self.blacklist_ttl
+            self._dirty.add(miner)
+
+    def flush(self) -> None:
+        """Append the entries changed since the last flush to the log."""
+
+        if self.path is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                lines = [
+                    json.dumps({"miner": miner, **asdict(self._entries[miner])}) + "\n"
+                    for miner in self._dirty if miner in self._entries
+                ]
+                self._dirty.clear()
+                compact = self._log_lines + len(lines) > 2 * len(self._entries) + 1000
+            if compact:
+                self._compact()
+            elif lines:
+                with open(self.path, "a") as log_file:
+                    log_file.writelines(lines)
+                self._log_lines += len(lines)
+
+    def _entry(self, miner: str) -> Reputation:
+        entry = self._entries.get(miner)
+        if entry is None:
+            entry = self._entries[miner] = Reputation()
+        return entry
+
+    def _load(self) -> None:
+        try:
+            with open(self.path) as log_file:
+                lines = log_file.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+                miner = record.pop("miner")
+                self._entries[miner] = Reputation(**record)
+            except (ValueError, TypeError, KeyError):
+                # a line cut short by a crash, the previous state of that miner still holds
+                continue
+        self._log_lines = len(lines)
+
+        now = self.clock()
+        for miner, entry in list(self._entries.items()):
+            blacklisted = entry.blacklisted_until is not None and entry.blacklisted_until > now
+            if not blacklisted and (entry.last_checked is None or entry.last_checked < now - self.retention):
+                del self._entries[miner]
+        if lines and not lines[-1].endswith("\n"):
+            # appending after a cut line would corrupt the next record too
+            self._compact()
+
+    def _compact(self) -> None:
+        # rewrite the live entries only, atomically replacing the old log
+        with self._lock:
+            lines = [json.dumps({"miner": miner, **asdict(entry)}) + "\n" for miner, entry in self._entries.items()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as log_file:
+            log_file.writelines(lines)
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(lines)
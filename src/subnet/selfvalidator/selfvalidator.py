@@ -1,75 +1,35 @@
 import asyncio
-import concurrent.futures
 import json
 import os
-import re
 import time
-import requests
 from functools import partial
 import tweepy
 from datetime import datetime, timedelta
-import random
+from typing import Any
 
 from communex.client import CommuneClient  # type: ignore
-from communex.module.client import ModuleClient  # type: ignore
 from communex.module.module import Module  # type: ignore
 from communex.types import Ss58Address  # type: ignore
 from substrateinterface import Keypair  # type: ignore
 
 from ._config import ValidatorSettings
-from utils.utils import log
+from .reputation import ReputationStore
+from .spotcheck import SpotCheckScheduler
+from .verification import VerificationQueue
+from utils.backend import BackendClient
+from utils.cache import TTLCache
+from utils.connections import MinerConnectionPool, MinerTimeoutError
+from utils.dispatch import MinerDispatcher, hedged
+from utils.latency import LatencyTracker
+from utils.logger import SAMPLED, get_logger
+from utils.matching import GroundTruth
+from utils.metagraph import MetagraphCache, get_subnet_netuid
+from utils.scoring import ScoringClient
+from utils.weights import set_weights
+from utils.wire import EncodingNegotiator
+
+logger = get_logger(__name__)
 
-IP_REGEX = re.compile(r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+")
-
-
-def set_weights(
-        settings: ValidatorSettings,
-        score_dict: dict[
-            int, float
-        ],
-        netuid: int,
-        client: CommuneClient,
-        key: Keypair,
-) -> None:
-    score_dict = cut_to_max_allowed_weights(score_dict, settings.max_allowed_weights)
-    weighted_scores: dict[int, int] = {}
-    scores = sum(score_dict.values())
-    for uid, score in score_dict.items():
-        weight = int(score / scores * 10000)
-        weighted_scores[uid] = weight
-
-    weighted_scores = {k: v for k, v in weighted_scores.items() if v != 0}
-    uids = list(weighted_scores.keys())
-    weights = list(weighted_scores.values())
-    client.vote(key=key, uids=uids, weights=weights, netuid=netuid)
-
-
-def cut_to_max_allowed_weights(
-        score_dict: dict[int, float], max_allowed_weights: int
-) -> dict[int, float]:
-    sorted_scores = sorted(score_dict.items(), key=lambda x: x[1], reverse=True)
-    cut_scores = sorted_scores[:max_allowed_weights]
-    return dict(cut_scores)
-
-
-def extract_address(string: str):
-    return re.search(IP_REGEX, string)
-
-
-def get_subnet_netuid(clinet: CommuneClient, subnet_name: str = "market-compass"):
-    subnets = clinet.query_map_subnet_names()
-    for netuid, name in subnets.items():
-        if name == subnet_name:
-            return netuid
-    raise ValueError(f"Subnet {subnet_name} not found")
-
-
-def get_ip_port(modules_adresses: dict[int, str]):
-    filtered_addr = {id: extract_address(addr) for id, addr in modules_adresses.items()}
-    ip_port = {
-        id: x.group(0).split(":") for id, x in filtered_addr.items() if x is not None
-    }
-    return ip_port
 
 class SelfTwitterValidator(Module):
     def __init__(
@@ -78,99 +38,94 @@ class SelfTwitterValidator(Module):
             netuid: int,
             client: CommuneClient,
             call_timeout: int = 3,
-
+            hedge_requests: bool = False,
+            twitter_client: Any | None = None,
+            settings: ValidatorSettings | None = None,
     ) -> None:
         super().__init__()
         self.client = client
         self.key = key
         self.netuid = netuid
         self.call_timeout = call_timeout
+        self.hedge_requests = hedge_requests
+        self.latency = LatencyTracker()
+        self.connection_pool = MinerConnectionPool(key)
+        self.wire = EncodingNegotiator()
+        self.metagraph = MetagraphCache(client, netuid)
         self.mc_subnet_url = os.getenv('MC_SUBNET_API_URL')
-        self.twitter_client = tweepy.Client(bearer_token=os.getenv('MC_BEARER_TOKEN'))
-        self.query_counts = {}
-        self.last_global_execution_time = 0
-        self.global_time_elapsed = 0
-        self.blacklist = {}
-
-    def get_addresses(self, client: CommuneClient, netuid: int) -> dict[int, str]:
-        module_addreses = client.query_map_address(netuid)
-        return module_addreses
+        self.backend = BackendClient(self.mc_subnet_url)
+        self.twitter_client = twitter_client or tweepy.Client(bearer_token=os.getenv('MC_BEARER_TOKEN'))
+        settings = settings or ValidatorSettings()  # type: ignore
+        # one full-archive search per query window, shared by every miner checked against it
+        self.ground_truth: TTLCache[tuple, GroundTruth] = TTLCache(
+            maxsize=settings.ground_truth_cache_size, ttl=settings.ground_truth_ttl
+        )
+        # spot check history and blacklist, keyed by miner ss58 address
+        self.reputation = ReputationStore(settings.reputation_path, blacklist_ttl=settings.blacklist_ttl)
+        self.spot_checks = SpotCheckScheduler(
+            budget=settings.spot_check_budget, window=settings.spot_check_window, reputation=self.reputation
+        )
+        self.verification = VerificationQueue(self.query_twitter_and_check, workers=settings.verification_workers)
 
     async def get_votes(self) -> list[str]:
-        response = requests.get(f'{self.mc_subnet_url}/subnet/getLatestVoting')
+        response = await self.backend.request('GET', '/subnet/getLatestVoting')
         if response.ok:
             return response.json()
         raise Exception("cant get latest voting")
 
     async def get_prompts(self, count: int) -> list[str]:
-        response = requests.get(f'{self.mc_subnet_url}/subnet/getNextOpenRequests?count={count}')
+        response = await self.backend.request('GET', '/subnet/getNextOpenRequests', params={'count': count})
         if response.ok:
             return response.json()
         raise Exception("cant get prompt")
 
-    def _get_miner_prediction(
-                self,
-                all_prompts: list,
-                miner_info: tuple[int, tuple[list[str], Ss58Address]],
-        ) -> str | None:
-            miner_index, [connection, miner_key] = miner_info
-            module_ip, module_port = connection
-            client = ModuleClient(module_ip, int(module_port), self.key)
-            prompt = all_prompts[miner_index]['query']
+    async def _get_miner_prediction(
+            self,
+            all_prompts: list,
+            miner_info: tuple[int, tuple[int, tuple[tuple[str, str], Ss58Address]]],
+    ) -> str | None:
+        miner_index, [uid, [connection, miner_key]] = miner_info
+        module_ip, module_port = connection
+        client = self.connection_pool.get(module_ip, int(module_port), miner_key)
+        prompt = all_prompts[miner_index]['query']
+
+        deadline = self.latency.deadline(uid, self.call_timeout)
+        hedge_delay = self.latency.hedge_delay(uid, deadline) if self.hedge_requests else None
+
+        async def send(params: dict, timeout: float):
+            return await client.call(
+                "generate",
+                miner_key,
+                params,
+                timeout=timeout,  #  type: ignore
+            )
+
+        async def call(timeout: float):
+            return await self.wire.call(send, miner_key, {"prompt": prompt}, timeout)
+
+        started = time.monotonic()
+        try:
+            miner_answer = await hedged(call, deadline, hedge_delay)
+            self.latency.record(uid, time.monotonic() - started)
 
-            try:
-                miner_answer = asyncio.run(
-                    client.call(
-                        "generate",
-                        miner_key,
-                        {"prompt": prompt},
-                        timeout=self.call_timeout,  #  type: ignore
-                    )
-                )
-
-            except Exception as e:
-                log(f"Miner {module_ip}:{module_port} failed to generate an answer")
-                print(e)
-                miner_answer = None
-            return miner_answer
-
-    def is_ninety_percent_match(self, arr1, arr2):
-        percentage = self.get_matching_percentage(arr1, arr2)
-        return percentage >= 90
-
-    def get_matching_percentage(self, arr1, arr2):
-        if not arr1 or not arr2:
-            return 0
-
-        matches = 0
-        arr2_texts = [tweet['text'] for tweet in arr2]
-
-        for tweet1 in arr1:
-            if tweet1['text'] in arr2_texts:
-                matches += 1
-
-        percentage = (matches / len(arr1)) * 100
-        return percentage
-
-
-    async def check_miner_response(self, content: str, miner_id: str, prompt: str) -> int:
-        self.query_counts[miner_id] = self.query_counts.get(miner_id, 0) + 1
-        current_time = int(datetime.utcnow().timestamp() * 1000)
-        self.global_time_elapsed = current_time - self.last_global_execution_time
-
-        if miner_id in self.blacklist:
+        except Exception as e:
+            if isinstance(e, MinerTimeoutError):
+                self.latency.timed_out(uid, deadline, self.call_timeout)
+            logger.info("Miner %s:%s failed to generate an answer: %s", module_ip, module_port, e, extra=SAMPLED)
+            miner_answer = None
+        return miner_answer
+
+    async def check_miner_response(self, content: str, miner_key: str, prompt: str) -> int:
+        if self.reputation.is_blacklisted(miner_key):
             return 0.05
 
-        if (self.query_counts[miner_id] > 0 or random.random() < 0.01) and self.global_time_elapsed > 10000:
-            self.last_global_execution_time = current_time
-            passed = await self.query_twitter_and_check(content, miner_id, prompt)
-            if not passed:
-                self.blacklist[miner_id] = datetime.utcnow().timestamp() * 1000
-                return 0.05
-
+        # the score is provisional: the answers to verify are picked once the step has them all,
+        # see `validate_step`, and a failed check lowers it at the next weight setting
         return 1
 
-    async def query_twitter_and_check(self, user_content, miner_id, prompt):
+    def ground_truth_options(self, user_content) -> dict:
+        """The Twitter search options that give the ground truth of an answer."""
+
         user_start_time = user_content[0]['created_at']
         user_start_date = datetime.strptime(user_start_time, "%Y-%m-%dT%H:%M:%S.%fZ")
         current_date = datetime.utcnow()
@@ -186,32 +141,50 @@ class SelfTwitterValidator(Module):
 
         if not is_diff_longer_than_half_minute:
             options["end_time"] = user_start_time
+        return options
 
-        js_tweets = self.twitter_client.search_all_tweets(prompt, **options)
-        tweets = [tweet.data for tweet in js_tweets.data]
-
-        passed = self.is_ninety_percent_match(tweets, user_content)
-        self.query_counts[miner_id] = 0
-        if not passed:
-            self.blacklist[miner_id] = datetime.utcnow().timestamp() * 1000
-            return 0.05
+    async def query_twitter_and_check(self, user_content, miner_key, prompt, options: dict | None = None):
+        # the options are fixed when the check is picked, so it runs the search its budget paid for
+        if options is None:
+            try:
+                options = self.ground_truth_options(user_content)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                # not a list of tweets with a readable creation time: the answer itself fails the check
+                logger.info("Miner %s answered with malformed tweets: %s", miner_key, e)
+                self.spot_checks.record(miner_key, False)
+                return False
+        truth = await self.ground_truth.aget_or_compute(
+            (prompt, options["start_time"], options.get("end_time")),
+            lambda: asyncio.to_thread(self._fetch_ground_truth, prompt, options),
+        )
+
+        if not truth:
+            # nothing to compare with, e.g. a query with no recent tweets: no verdict either way
+            logger.info("No tweets found for '%s', the answer of miner %s cannot be verified", prompt, miner_key)
+            return None
 
+        passed = truth.match(user_content) >= 90
+        # a failed check also blacklists the miner for a while
+        self.spot_checks.record(miner_key, passed)
+        return passed
 
-        return 1
+    def _fetch_ground_truth(self, prompt: str, options: dict) -> GroundTruth:
+        js_tweets = self.twitter_client.search_all_tweets(prompt, **options)
+        return GroundTruth(tweet.data for tweet in js_tweets.data or [])
 
     async def validate_step(
             self, syntia_netuid: int, settings: ValidatorSettings
     ) -> None:
 
-        modules_adresses = self.get_addresses(self.client, syntia_netuid)
-        modules_keys = self.client.query_map_key(syntia_netuid)
+        metagraph = await self.metagraph.snapshot()
+        modules_keys = metagraph.keys
         val_ss58 = self.key.ss58_address
         if val_ss58 not in modules_keys.values():
             raise RuntimeError(f"validator key {val_ss58} is not registered in subnet")
 
-        modules_info: dict[int, tuple[list[str], Ss58Address]] = {}
+        modules_info: dict[int, tuple[tuple[str, str], Ss58Address]] = {}
 
-        modules_filtered_address = get_ip_port(modules_adresses)
+        modules_filtered_address = metagraph.ip_ports
         for module_id in modules_keys.keys():
             module_addr = modules_filtered_address.get(module_id, None)
             if not module_addr:
@@ -219,45 +192,99 @@ class SelfTwitterValidator(Module):
 
             modules_info[module_id] = (module_addr, modules_keys[module_id])
 
+        await self.connection_pool.sync(modules_info)
+        self.latency.retain(modules_info.keys())
+
         score_dict: dict[int, float] = {}
 
-        log(f"Selected the following miners: {modules_info.keys()}")
+        logger.info("Selected the following miners: %s", list(modules_info))
 
         try:
             all_prompts = await self.get_prompts(len(modules_info.values()))
         except Exception as e:
-            print('problem with getting prompts', e)
+            logger.warning('Problem with getting prompts: %s', e)
             return
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=80) as executor:
-            get_miner_prediction = partial(self._get_miner_prediction, all_prompts)
-            it = executor.map(get_miner_prediction, enumerate(modules_info.values()))
-            miner_answers = [*it]
-
-        for index, [mid, miner_response] in enumerate(zip(modules_info.keys(), miner_answers)):
-            miner_answer = miner_response
-            used_prompt = all_prompts[index]['query']
-            print(used_prompt)
-
-            if not miner_answer:
-                log(f"Skipping miner {mid} that didn't answer")
-                continue
-
-            score = await self.check_miner_response(miner_answer, mid, used_prompt)
-            print('Score from validation. UID:', mid, score)
+        dispatcher = MinerDispatcher(settings.max_concurrent_queries)
+        get_miner_prediction = partial(self._get_miner_prediction, all_prompts)
+
+        async def answered_prompts():
+            # answers are handed to the checks as soon as each miner responds
+            async for (index, [mid, _]), miner_answer in dispatcher.as_completed(
+                    get_miner_prediction, enumerate(modules_info.items())
+            ):
+                used_prompt = all_prompts[index]['query']
+                logger.debug("Prompt of miner %s: %s", mid, used_prompt)
+
+                if not miner_answer:
+                    logger.info("Skipping miner %s that didn't answer", mid, extra=SAMPLED)
+                    continue
+
+                submissions.append((mid, used_prompt, miner_answer))
+                yield mid, used_prompt, miner_answer
+
+        submissions: list[tuple[int, str, Any]] = []
+        miner_keys = {mid: miner_key for mid, (_, miner_key) in modules_info.items()}
+
+        async def check(content, miner_id, prompt):
+            return await self.check_miner_response(content, miner_keys[miner_id], prompt)
+
+        # answers are scored as they stream in
+        scoring_client = ScoringClient(check, settings.max_concurrent_scoring)
+        validation_scores = await scoring_client.score(answered_prompts())
+
+        # spot checks go to the riskiest answers of the step, so they are picked once every answer is in
+        candidates = [
+            (miner_keys[mid], prompt, content) for mid, prompt, content in submissions
+            if not self.reputation.is_blacklisted(miner_keys[mid])
+        ]
+        # the budget is charged per distinct Twitter search, answers that need the same one share it
+        searches: dict[str, dict | None] = {}
+        search_keys: dict[str, tuple] = {}
+        for miner_key, prompt, content in candidates:
+            try:
+                options = self.ground_truth_options(content)
+            except (KeyError, IndexError, TypeError, ValueError):
+                searches[miner_key], search_keys[miner_key] = None, (miner_key,)
+            else:
+                searches[miner_key] = options
+                search_keys[miner_key] = (prompt, options["start_time"], options.get("end_time"))
+        selected = self.spot_checks.select(
+            {miner_key: content for miner_key, _, content in candidates}, search_keys
+        )
+        logger.info(
+            "Spot checking miners: %s", sorted(mid for mid, miner_key in miner_keys.items() if miner_key in selected)
+        )
+        for miner_key, prompt, content in candidates:
+            if miner_key in selected:
+                self.verification.submit(miner_key, prompt, content, searches[miner_key])
+        # persist the outcome of this step's checks without holding up the loop
+        await asyncio.to_thread(self.reputation.flush)
+        if settings.latency_stats_path:
+            self.latency.dump(settings.latency_stats_path)
+
+        for mid, score in validation_scores.items():
+            logger.info('Score from validation. UID: %s %s', mid, score, extra=SAMPLED)
 
-            time.sleep(0.5)
             # score has to be lower or eq to 1, as one is the best score, you can implement your custom logic
             if score <= 1:
                 score_dict[mid] = score
             else:
-                print('WARN: score > 1. Uid:', mid, score)
+                logger.warning('Score > 1. Uid: %s %s', mid, score)
+
+        # verdicts of the checks that finished since the last weights, including earlier steps
+        miner_uids = {miner_key: mid for mid, miner_key in miner_keys.items()}
+        for miner_key, passed in self.verification.drain().items():
+            mid = miner_uids.get(miner_key)
+            if not passed and mid in score_dict:
+                logger.info("Miner %s failed its spot check", mid)
+                score_dict[mid] = 0.05
 
         if not score_dict:
-            log("No miner managed to give a valid answer")
+            logger.info("No miner managed to give a valid answer")
             return None
 
-        print('all scores', score_dict.items())
+        logger.info('All scores: %s', score_dict)
 
         _ = set_weights(settings, score_dict, self.netuid, self.client, self.key)
 
@@ -269,12 +296,16 @@ class SelfTwitterValidator(Module):
             settings: The validator settings to use for the validation loop.
         """
 
+        # a single loop for the whole run keeps pooled miner connections alive between steps
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
         while True:
             start_time = time.time()
-            _ = asyncio.run(self.validate_step(self.netuid, settings))
+            _ = loop.run_until_complete(self.validate_step(self.netuid, settings))
 
             elapsed = time.time() - start_time
             if elapsed < settings.iteration_interval:
                 sleep_time = settings.iteration_interval - elapsed
-                log(f"Sleeping for {sleep_time}")
-                time.sleep(sleep_time)
+                logger.info("Sleeping for %.1fs", sleep_time)
+                # sleep on the loop, so queued spot checks keep running in the meantime
+                loop.run_until_complete(asyncio.sleep(sleep_time))
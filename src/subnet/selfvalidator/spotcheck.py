@@ -0,0 +1,127 @@
+import time
+from collections import deque
+from typing import Any, Callable, Hashable, Mapping
+
+from .reputation import ReputationStore
+
+
+def answer_anomaly(answer: Any) -> float:
+    """
+    How suspicious an answer looks without asking Twitter, from 0 to 1.
+
+    Every failed property counts for an equal share: the answer is a
+    non-empty list of tweets with an id, a text and a creation time, ids are
+    unique, and tweets are ordered newest first as the search API returns
+    them.
+    """
+
+    if not isinstance(answer, list) or not answer:
+        return 1.0
+    tweets = [tweet for tweet in answer if isinstance(tweet, dict)]
+    flags = [
+        len(tweets) < len(answer),
+        any(not tweet.get("id") or not isinstance(tweet.get("text"), str) for tweet in tweets),
+        len({tweet.get("id") for tweet in tweets}) < len(tweets),
+    ]
+    created = [tweet.get("created_at") for tweet in tweets]
+    if all(isinstance(timestamp, str) for timestamp in created):
+        # the API timestamps are fixed width ISO 8601, so they sort as strings
+        flags.append(any(following > current for current, following in zip(created, created[1:])))
+    else:
+        flags.append(True)
+    return sum(flags) / len(flags)
+
+
+class SpotCheckScheduler:
+    """
+    Decides which miner answers are verified against the Twitter API.
+
+    At most `budget` checks are spent per `window` seconds. Each step, the
+    answers are ranked by risk and the riskiest ones get the checks
+    available. Risk adds up three terms, each from 0 to 1:
+
+    - staleness: time since the miner was last checked, relative to
+      `horizon`; a miner that was never checked is fully stale,
+    - failures: the share of its past checks the miner failed,
+    - anomaly: `answer_anomaly` of the answer at hand.
+
+    Ties go to the lower miner key, so for a given history and clock the
+    choice is deterministic. The history lives in `reputation`, which shares
+    the scheduler's clock.
+    """
+
+    def __init__(
+            self,
+            budget: int = 6,
+            window: float = 60,
+            horizon: float = 3600,
+            weights: tuple[float, float, float] = (1.0, 2.0, 2.0),
+            clock: Callable[[], float] = time.time,
+            reputation: ReputationStore | None = None,
+    ) -> None:
+        self.budget = budget
+        self.window = window
+        self.horizon = horizon
+        self.weights = weights
+        self.clock = clock
+        self.reputation = reputation if reputation is not None else ReputationStore(clock=clock)
+        self._spent: deque[float] = deque()
+
+    def available(self) -> int:
+        """The checks left in the current window."""
+
+        now = self.clock()
+        while self._spent and self._spent[0] <= now - self.window:
+            self._spent.popleft()
+        return max(self.budget - len(self._spent), 0)
+
+    def risk(self, miner_id: str, answer: Any) -> float:
+        record = self.reputation.get(miner_id)
+        if record is None or record.last_checked is None:
+            staleness = 1.0
+        else:
+            staleness = min((self.clock() - record.last_checked) / self.horizon, 1.0)
+        failures = record.failures / record.checks if record is not None and record.checks else 0.0
+        w_stale, w_fail, w_anomaly = self.weights
+        return w_stale * staleness + w_fail * failures + w_anomaly * answer_anomaly(answer)
+
+    def select(
+            self,
+            answers: Mapping[str, Any],
+            queries: Mapping[str, Hashable] | None = None,
+    ) -> set[str]:
+        """
+        Pick the answers to verify this step and spend the budget for them.
+
+        Args:
+            answers: The answer of every miner, keyed by miner key.
+            queries: The Twitter search each check needs, keyed by miner
+                key. The budget is charged once per distinct search: checks
+                of answers that need a search already being paid for reuse
+                it, so they are free.
+
+        Returns:
+            The keys of the miners to check.
+        """
+
+        available = self.available()
+        ranked = sorted(answers, key=lambda miner_id: (-self.risk(miner_id, answers[miner_id]), miner_id))
+        selected: set[str] = set()
+        paid: set[Hashable] = set()
+        for miner_id in ranked:
+            query = queries[miner_id] if queries is not None else miner_id
+            if query not in paid:
+                if len(paid) >= available:
+                    continue
+                paid.add(query)
+            selected.add(miner_id)
+
+        self._spent.extend([self.clock()] * len(paid))
+        for miner_id in selected:
+            self.reputation.touch(miner_id)
+        return selected
+
+    def record(self, miner_id: str, passed: bool) -> None:
+        """Record the outcome of a check."""
+
+        self.reputation.record_check(miner_id, passed)
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# (miner key, prompt, miner answer, search options)
+Verification = tuple[str, str, Any, Any]
+
+
+class VerificationQueue:
+    """
+    Runs spot checks in the background, off the scoring path.
+
+    Checks are queued with `submit` and picked up by `workers` tasks on the
+    running event loop, which must keep running between validation steps
+    for them to make progress. Each verdict is kept until `drain` hands it
+    to the next weight setting. A check that returns None reached no
+    verdict, nor did one that raised: `verify` rejects bad answers itself
+    and only raises when the check could not run, e.g. Twitter was
+    unreachable. When the queue is full, new checks are dropped rather than
+    delaying the step.
+    """
+
+    def __init__(
+            self,
+            verify: Callable[[Any, str, str, Any], Awaitable[bool | None]],
+            workers: int = 2,
+            maxsize: int = 256,
+    ) -> None:
+        self.verify = verify
+        self.workers = workers
+        self._queue: asyncio.Queue[Verification] = asyncio.Queue(maxsize)
+        self._tasks: list[asyncio.Task] = []
+        self._verdicts: dict[str, bool] = {}
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, miner_key: str, prompt: str, content: Any, options: Any = None) -> bool:
+        """
+        Queue a check of a miner answer.
+
+        Args:
+            miner_key: The ss58 address of the miner.
+            prompt: The query the miner answered.
+            content: The miner answer.
+            options: Handed to `verify` along with the answer, e.g. the
+                search the check was charged for.
+
+        Returns:
+            Whether the check was queued.
+        """
+
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        try:
+            self._queue.put_nowait((miner_key, prompt, content, options))
+        except asyncio.QueueFull:
+            logger.warning("Verification queue is full, skipping the check of miner %s", miner_key)
+            return False
+        return True
+
+    def drain(self) -> dict[str, bool]:
+        """The verdicts reached since the last call, keyed by miner key."""
+
+        verdicts, self._verdicts = self._verdicts, {}
+        return verdicts
+
+    async def _work(self) -> None:
+        while True:
+            miner_key, prompt, content, options = await self._queue.get()
+            try:
+                passed = await self.verify(content, miner_key, prompt, options)
+            except Exception as e:
+                logger.warning("Failed to verify the answer of miner %s: %s", miner_key, e)
+            else:
+                if passed is not None:
+                    # a failure is never overwritten by a later pass before it is drained
+                    self._verdicts[miner_key] = self._verdicts.get(miner_key, True) and passed
+            finally:
+                self._queue.task_done()
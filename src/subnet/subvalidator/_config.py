@@ -4,3 +4,8 @@ class ValidatorSettings(BaseSettings):
     subnet_name: str = 'market-compass'
     iteration_interval: int = 60  # Set, accordingly to your tempo.
     max_allowed_weights: int = 420  # Query dynamically based on your subnet settings.
+    vote_change_threshold: float = 0.01  # Share of the weights that must move before voting again.
+    max_vote_staleness: int = 3600  # Seconds after which the weights are voted again even if unchanged.
+    voting_subscription: bool = False  # Watch /subnet/watchLatestVoting instead of polling, if the backend serves it.
+    subscription_timeout: int = 50  # Seconds the backend may hold a voting watch.
+    subscription_retry: int = 600  # Seconds of polling before watching again after a failed watch.
@@ -2,9 +2,7 @@ import asyncio
 import concurrent.futures
 import json
 import os
-import re
 import time
-import requests
 from functools import partial
 
 from communex.client import CommuneClient  # type: ignore
@@ -14,65 +12,17 @@ from communex.types import Ss58Address  # type: ignore
 from substrateinterface import Keypair  # type: ignore
 
 from ._config import ValidatorSettings
-from utils.utils import log
+from utils.backend import BackendClient
+from utils.logger import get_logger
+from utils.metagraph import get_subnet_netuid
+from utils.weights import compute_weights, set_weights, weight_change
 
-IP_REGEX = re.compile(r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+")
+logger = get_logger(__name__)
 
-
-def set_weights(
-        settings: ValidatorSettings,
-        score_dict: dict[
-            int, float
-        ],
-        netuid: int,
-        client: CommuneClient,
-        key: Keypair,
-) -> None:
-
-    print('scoreDict:', score_dict)
-    score_dict = cut_to_max_allowed_weights(score_dict, settings.max_allowed_weights)
-    print('scoreDict2:', score_dict)
-    weighted_scores: dict[int, int] = {}
-    scores = sum(score_dict.values())
-    print(scores)
-    for uid, score in score_dict.items():
-        weight = int(score / scores * 10000)
-        weighted_scores[uid] = weight
-
-    weighted_scores = {k: v for k, v in weighted_scores.items() if v != 0}
-    uids = list(weighted_scores.keys())
-    weights = list(weighted_scores.values())
-    print(uids)
-    print(weights)
-    client.vote(key=key, uids=uids, weights=weights, netuid=netuid)
-
-
-def cut_to_max_allowed_weights(
-        score_dict: dict[int, float], max_allowed_weights: int
-) -> dict[int, float]:
-    sorted_scores = sorted(score_dict.items(), key=lambda x: x[1], reverse=True)
-    cut_scores = sorted_scores[:max_allowed_weights]
-    return dict(cut_scores)
-
-
-def extract_address(string: str):
-    return re.search(IP_REGEX, string)
-
-
-def get_subnet_netuid(clinet: CommuneClient, subnet_name: str = "market-compass"):
-    subnets = clinet.query_map_subnet_names()
-    for netuid, name in subnets.items():
-        if name == subnet_name:
-            return netuid
-    raise ValueError(f"Subnet {subnet_name} not found")
-
-
-def get_ip_port(modules_adresses: dict[int, str]):
-    filtered_addr = {id: extract_address(addr) for id, addr in modules_adresses.items()}
-    ip_port = {
-        id: x.group(0).split(":") for id, x in filtered_addr.items() if x is not None
-    }
-    return ip_port
+# extra time given to a voting watch over the time the backend may hold it
+WATCH_GRACE = 10
+# a watch answered faster than this was not held; watches never start more often
+MIN_WATCH = 1
 
 
 class SubTwitterValidator(Module):
@@ -90,50 +40,150 @@ class SubTwitterValidator(Module):
         self.netuid = netuid
         self.call_timeout = call_timeout
         self.mc_subnet_url = os.getenv('MC_SUBNET_API_URL')
+        self.backend = BackendClient(self.mc_subnet_url)
+        self.votes: dict[str, float] | None = None
+        self.votes_etag: str | None = None
+        self.last_vote: tuple[list[int], list[int]] | None = None
+        self.last_vote_at = 0.0
+
+    async def get_votes(self, wait: float | None = None) -> dict[str, float]:
+        """
+        Fetch the latest voting from the backend.
+
+        The ETag of the last voting is sent back as `If-None-Match`, so an
+        unchanged voting costs the backend a 304 instead of the whole map.
+
+        Args:
+            wait: Watch the voting instead: the backend holds the request
+                for up to this many seconds and answers as soon as a new
+                voting is registered.
 
-    async def get_votes(self) -> list[str]:
-        response = requests.get(f'{self.mc_subnet_url}/subnet/getLatestVoting')
+        Returns:
+            The voting, mapping uids to scores.
+        """
+
+        headers = {"If-None-Match": self.votes_etag} if self.votes is not None and self.votes_etag else None
+        if wait is None:
+            response = await self.backend.request('GET', '/subnet/getLatestVoting', headers=headers)
+        else:
+            started = time.monotonic()
+            response = await self.backend.request(
+                'GET',
+                '/subnet/watchLatestVoting',
+                params={"timeout": wait},
+                headers=headers,
+                timeout=wait + WATCH_GRACE,
+                # a retried watch could hold the loop for several times `wait`
+                retries=0,
+            )
+            held = time.monotonic() - started >= MIN_WATCH
+            # a fast answer is only fine when it brings a new voting whose ETag the next watch can wait on
+            if not held and (response.status == 304 or not response.headers.get("ETag")):
+                raise Exception("the backend does not hold voting watches")
+        if response.status == 304 and self.votes is not None:
+            return self.votes
         if response.ok:
-            return response.json()
+            self.votes = response.json()
+            self.votes_etag = response.headers.get("ETag")
+            return self.votes
         raise Exception("cant get latest voting")
 
+    def should_vote(self, vote: tuple[list[int], list[int]], settings: ValidatorSettings) -> bool:
+        """
+        Whether `vote` is worth a chain transaction.
+
+        It is when the shares moved by at least `vote_change_threshold` since
+        the last vote, see `weight_change`, or when the last vote is older
+        than `max_vote_staleness` seconds.
+        """
+
+        if self.last_vote is None:
+            return True
+        age = time.time() - self.last_vote_at
+        change = weight_change(self.last_vote, vote)
+        if change < settings.vote_change_threshold and age < settings.max_vote_staleness:
+            logger.info("Weights moved by %.4f since the last vote %.0fs ago, skipping the vote", change, age)
+            return False
+        return True
+
     async def validate_step(
-            self, mc_netuid: int, settings: ValidatorSettings
-    ) -> None:
+            self, mc_netuid: int, settings: ValidatorSettings, wait: float | None = None
+    ) -> bool:
+        """
+        Fetch the latest voting and set it as weights if it is worth a vote.
+
+        Args:
+            mc_netuid: The netuid of the subnet.
+            settings: The validator settings.
+            wait: Watch the voting for up to this many seconds, see `get_votes`.
+
+        Returns:
+            Whether the voting could be fetched.
+        """
 
         score_dict: dict[int, float] = {}
 
         try:
-            all_votes = await self.get_votes()
-            print(all_votes)
+            all_votes = await self.get_votes(wait)
+            logger.debug('Latest voting: %s', all_votes)
         except Exception as e:
-            print('problem with getting latest voting', e)
-            return
+            logger.warning('Problem with getting the latest voting: %s', e)
+            return False
 
         score_dict = all_votes
 
         if not score_dict:
-            log("No miner managed to give a valid answer")
-            return None
+            logger.info("No miner managed to give a valid answer")
+            return True
+
+        logger.info('All scores: %s', score_dict)
 
-        print('all scores', score_dict.items())
+        vote = compute_weights(score_dict, settings.max_allowed_weights)
+        if not vote[0]:
+            logger.info("No positive scores, skipping the vote")
+            return True
+        if not self.should_vote(vote, settings):
+            return True
 
         _ = set_weights(settings, score_dict, self.netuid, self.client, self.key)
+        self.last_vote, self.last_vote_at = vote, time.time()
+        return True
 
     def validation_loop(self, settings: ValidatorSettings) -> None:
         """
         Run the validation loop continuously based on the provided settings.
 
+        With `voting_subscription`, the voting is watched so that new weights
+        follow a registered voting within seconds. When the watch fails, e.g.
+        the connection dropped or the backend has no watch endpoint, the loop
+        polls every `iteration_interval` and tries watching again after
+        `subscription_retry` seconds.
+
         Args:
             settings: The validator settings to use for the validation loop.
         """
 
+        # a single loop for the whole run keeps the pooled backend session alive between steps
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        watch_after = 0.0
         while True:
             start_time = time.time()
-            _ = asyncio.run(self.validate_step(self.netuid, settings))
+            watch = settings.voting_subscription and start_time >= watch_after
+            wait = settings.subscription_timeout if watch else None
+            fetched = loop.run_until_complete(self.validate_step(self.netuid, settings, wait))
+            if wait is not None:
+                if fetched:
+                    # whatever the backend answers, watching cannot turn into a busy loop
+                    time.sleep(max(MIN_WATCH - (time.time() - start_time), 0))
+                    continue
+                # a voting may have been missed while the watch was down, poll it right away
+                logger.warning("Voting watch failed, polling for the next %ss", settings.subscription_retry)
+                watch_after = start_time + settings.subscription_retry
+                continue
 
             elapsed = time.time() - start_time
             if elapsed < settings.iteration_interval:
                 sleep_time = settings.iteration_interval - elapsed
-                log(f"Sleeping for {sleep_time}")
+                logger.info("Sleeping for %.1fs", sleep_time)
                 time.sleep(sleep_time)
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import random
+from dataclasses import dataclass
+from typing import Any, Mapping
+
+import aiohttp
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class BackendError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class BackendResponse:
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    def text(self) -> str:
+        return self.body.decode()
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class BackendClient:
+    """
+    Shared async client for the MarketCompass backend API.
+
+    One pooled keep-alive session is opened lazily on the running event loop
+    and reused for every request. GET requests are retried on connection
+    errors, timeouts and 429/5xx answers with exponential backoff and full
+    jitter. POST requests are only retried when the connection could not be
+    opened, so a registration is never sent twice.
+    """
+
+    def __init__(
+            self,
+            base_url: str | None,
+            api_key: str | None = None,
+            timeout: float = 10,
+            retries: int = 3,
+            backoff: float = 0.5,
+            max_connections: int = 64,
+    ) -> None:
+        self.base_url = (base_url or "").rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=120)
+            headers = {"Accept-Encoding": "gzip, deflate"}
+            if self.api_key:
+                headers["x-api-key"] = self.api_key
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(
+            self,
+            method: str,
+            path: str,
+            *,
+            params: Mapping[str, Any] | None = None,
+            data: Mapping[str, Any] | None = None,
+            json_body: Any = None,
+            headers: Mapping[str, str] | None = None,
+            timeout: float | None = None,
+            retries: int | None = None,
+    ) -> BackendResponse:
+        """
+        Send a request to the backend, retrying transient failures.
+
+        Args:
+            method: The HTTP method.
+            path: The path below the base URL, e.g. `/subnet/getLatestVoting`.
+            params: Query string parameters.
+            data: Form fields for the request body.
+            json_body: A JSON-serializable request body.
+            headers: Extra request headers.
+            timeout: Overrides the client timeout for this request.
+            retries: Overrides the client retries for this request.
+
+        Returns:
+            The backend response, whatever its status.
+
+        Raises:
+            BackendError: If the request still fails after all retries.
+        """
+
+        session = self._get_session()
+        if retries is None:
+            retries = self.retries
+        idempotent = method.upper() in ("GET", "HEAD")
+        options: dict[str, Any] = {}
+        if timeout is not None:
+            options["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        attempt = 0
+        while True:
+            try:
+                async with session.request(
+                    method,
+                    f"{self.base_url}{path}",
+                    params=params,
+                    data=data,
+                    json=json_body,
+                    headers=headers,
+                    **options,
+                ) as response:
+                    body = await response.read()
+                    if not (idempotent and response.status in RETRY_STATUSES and attempt < retries):
+                        return BackendResponse(response.status, response.headers, body)
+            except aiohttp.ClientConnectorError as e:
+                if attempt >= retries:
+                    raise BackendError(f"{method} {path} failed: {e}") from e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not idempotent or attempt >= retries:
+                    raise BackendError(f"{method} {path} failed: {e!r}") from e
+
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            attempt += 1
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+@dataclass
+class _AsyncFlight:
+    task: asyncio.Future
+    waiters: int = 0
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Thread-safe in-process cache with a time to live and LRU eviction.
+
+    `aget_or_compute` also coalesces concurrent misses on the same key: the
+    first caller computes the value while the others wait for it, so a burst
+    of identical requests costs a single upstream call. Failures are handed
+    to every waiter and are not cached. Its flights must all be started
+    from one event loop.
+    """
+
+    def __init__(
+            self,
+            maxsize: int = 1024,
+            ttl: float = 30,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._async_flights: dict[K, _AsyncFlight] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K, default: Any = None) -> V | Any:
+        with self._lock:
+            value = self._get_locked(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: K, value: V) -> None:
+        with self._lock:
+            self._set_locked(key, value)
+
+    async def aget_or_compute(self, key: K, compute: Callable[[], Awaitable[V]]) -> V:
+        """
+        Return the cached value for `key`, computing it once on a miss.
+
+        The computation runs as its own task. A caller that is cancelled
+        stops waiting for it, and the computation itself is cancelled once
+        no caller is waiting for it anymore.
+
+        Args:
+            key: The cache key.
+            compute: Coroutine function producing a missing value.
+
+        Returns:
+            The cached or freshly computed value.
+        """
+
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        flight = self._async_flights.get(key)
+        if flight is None:
+            flight = self._async_flights[key] = _AsyncFlight(asyncio.ensure_future(compute()))
+            flight.task.add_done_callback(partial(self._finish_async_flight, key))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish_async_flight(self, key: K, task: asyncio.Future) -> None:
+        self._async_flights.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.set(key, task.result())
+
+    def _get_locked(self, key: K) -> V | Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_locked(self, key: K, value: V) -> None:
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
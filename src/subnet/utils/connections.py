@@ -0,0 +1,163 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import aiohttp
+from communex.module._protocol import create_method_endpoint, create_request_data  # type: ignore
+from communex.module.client import ModuleClient  # type: ignore
+from communex.types import Ss58Address  # type: ignore
+from substrateinterface import Keypair  # type: ignore
+
+PoolKey = tuple[str, int, str]
+
+
+class MinerTimeoutError(Exception):
+    pass
+
+
+class MinerStatusError(Exception):
+    """A miner answered a call with a status other than 200."""
+
+    def __init__(self, status: int, body: str) -> None:
+        super().__init__(f"Unexpected status code: {status}, response: {body}")
+        self.status = status
+        self.body = body
+
+
+class PooledModuleClient(ModuleClient):
+    """
+    A `ModuleClient` that sends its calls over a long-lived session instead
+    of opening a new one per call, so keep-alive connections are reused.
+    """
+
+    def __init__(self, host: str, port: int, key: Keypair, session: aiohttp.ClientSession) -> None:
+        super().__init__(host, port, key)
+        self.session = session
+        self.dead = False
+
+    async def call(
+            self,
+            fn: str,
+            target_key: Ss58Address,
+            params: Any = {},
+            timeout: int = 16,
+    ) -> Any:
+        serialized_data, headers = create_request_data(self.key, target_key, params)
+        out = aiohttp.ClientTimeout(total=timeout)
+        try:
+            async with self.session.post(
+                create_method_endpoint(self.host, self.port, fn),
+                json=json.loads(serialized_data),
+                headers=headers,
+                timeout=out,
+            ) as response:
+                if response.status != 200:
+                    raise MinerStatusError(response.status, await response.text())
+                match response.content_type:
+                    case "application/json":
+                        return await response.json()
+                    case "text/plain":
+                        return await response.text()
+                    case _:
+                        raise Exception(f"Unknown content type: {response.content_type}")
+        except aiohttp.ClientConnectionError:
+            # the connection is unusable, let the pool drop it on the next sync
+            self.dead = True
+            raise
+        except asyncio.TimeoutError as e:
+            raise MinerTimeoutError(f"The call took longer than the timeout of {timeout} second(s)") from e
+
+
+@dataclass
+class _PoolEntry:
+    client: PooledModuleClient
+    last_used: float
+
+
+class MinerConnectionPool:
+    """
+    Keep-alive connections to miners, keyed by (ip, port, ss58 key).
+
+    The pool outlives a single validation step. It must be used from one
+    event loop for its whole lifetime, since aiohttp sessions are bound to
+    the loop they were created on.
+    """
+
+    def __init__(
+            self,
+            key: Keypair,
+            idle_timeout: float = 600,
+            keepalive_timeout: float = 180,
+    ) -> None:
+        self.key = key
+        self.idle_timeout = idle_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self._entries: dict[PoolKey, _PoolEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, ip: str, port: int, ss58: Ss58Address) -> PooledModuleClient:
+        """
+        Return the pooled client for a miner, opening one if needed.
+
+        Args:
+            ip: The miner IP address.
+            port: The miner port.
+            ss58: The miner ss58 address.
+
+        Returns:
+            A client whose calls reuse the miner's keep-alive connection.
+        """
+
+        pool_key = (ip, int(port), ss58)
+        entry = self._entries.get(pool_key)
+        if entry is None or entry.client.dead:
+            if entry is not None:
+                self._close_later(entry)
+            connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=self.keepalive_timeout)
+            session = aiohttp.ClientSession(connector=connector)
+            entry = _PoolEntry(PooledModuleClient(ip, int(port), self.key, session), time.monotonic())
+            self._entries[pool_key] = entry
+        entry.last_used = time.monotonic()
+        return entry.client
+
+    async def sync(self, modules_info: dict[int, tuple[tuple[str, str], Ss58Address]]) -> None:
+        """
+        Drop connections that can no longer be reused.
+
+        An entry is evicted when its miner changed address or key, left the
+        subnet, died on a connection error, or sat idle past `idle_timeout`.
+
+        Args:
+            modules_info: The current uid -> ((ip, port), ss58 key) mapping.
+        """
+
+        live_keys = {
+            (ip_port[0], int(ip_port[1]), ss58)
+            for ip_port, ss58 in modules_info.values()
+        }
+        now = time.monotonic()
+        stale = [
+            pool_key for pool_key, entry in self._entries.items()
+            if pool_key not in live_keys
+            or entry.client.dead
+            or now - entry.last_used > self.idle_timeout
+        ]
+        for pool_key in stale:
+            entry = self._entries.pop(pool_key)
+            await entry.client.session.close()
+
+    async def close(self) -> None:
+        """Close every pooled connection."""
+
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            await entry.client.session.close()
+
+    @staticmethod
+    def _close_later(entry: _PoolEntry) -> None:
+        asyncio.get_running_loop().create_task(entry.client.session.close())
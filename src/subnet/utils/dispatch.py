@@ -0,0 +1,96 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def hedged(
+        call: Callable[[float], Awaitable[R]],
+        timeout: float,
+        hedge_delay: float | None = None,
+) -> R:
+    """
+    Await `call(timeout)`, sending a duplicate if it is slow to answer.
+
+    When `hedge_delay` is set and the first call has not finished by then,
+    a second call is started with the time left before `timeout`, and the
+    first successful answer wins. The loser is cancelled.
+
+    Args:
+        call: Coroutine function taking the time budget of the call.
+        timeout: The overall time budget.
+        hedge_delay: Seconds to wait before hedging, or None to never hedge.
+
+    Returns:
+        The result of the first call to succeed.
+    """
+
+    if hedge_delay is None or hedge_delay >= timeout:
+        return await call(timeout)
+
+    first = asyncio.create_task(call(timeout))
+    done, _ = await asyncio.wait({first}, timeout=hedge_delay)
+    if done:
+        return first.result()
+
+    second = asyncio.create_task(call(timeout - hedge_delay))
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        return first.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class MinerDispatcher:
+    """
+    Fan out miner queries on the running event loop.
+
+    All calls share a single loop and at most `max_concurrency` of them are
+    in flight at any time, so a step costs roughly one round trip instead of
+    one round trip per batch of worker threads.
+    """
+
+    def __init__(self, max_concurrency: int = 256) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+
+    async def as_completed(
+            self,
+            fn: Callable[[T], Awaitable[R]],
+            items: Iterable[T],
+    ) -> AsyncIterator[tuple[T, R]]:
+        """
+        Run `fn` over `items` concurrently and yield results as they finish.
+
+        A slow item only delays itself, so callers can start working on
+        the fast answers straight away.
+
+        Args:
+            fn: Coroutine function called once per item.
+            items: The items to dispatch.
+
+        Yields:
+            (item, result) pairs in completion order.
+        """
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(item: T) -> tuple[T, R]:
+            async with semaphore:
+                return item, await fn(item)
+
+        tasks = [asyncio.create_task(run(item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,125 @@
+import json
+import math
+from collections import deque
+from pathlib import Path
+from typing import Iterable
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class LatencyTracker:
+    """
+    Rolling per-miner latency history used to size call deadlines.
+
+    Each miner keeps its last `window` call durations. Once a miner has
+    `min_samples` of them, its deadline is its p95 times `margin`, clamped
+    between `floor` and the caller's ceiling. A call cut off by an adaptive
+    deadline drops the miner's history, so a miner that got legitimately
+    slower is given the full budget again from its next call on, until its
+    new latency is known.
+    """
+
+    def __init__(
+            self,
+            window: int = 50,
+            min_samples: int = 5,
+            margin: float = 1.5,
+            floor: float = 2.0,
+    ) -> None:
+        self.window = window
+        self.min_samples = min_samples
+        self.margin = margin
+        self.floor = floor
+        self._samples: dict[int, deque[float]] = {}
+
+    def record(self, uid: int, seconds: float) -> None:
+        samples = self._samples.get(uid)
+        if samples is None:
+            samples = self._samples[uid] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def timed_out(self, uid: int, deadline: float, ceiling: float) -> None:
+        """
+        Account for a call that ran out of its deadline.
+
+        Args:
+            uid: The miner uid.
+            deadline: The budget the call was given.
+            ceiling: The largest allowed budget, as passed to `deadline`.
+        """
+
+        if deadline < ceiling:
+            # the history no longer describes the miner, wait for new samples at the full budget
+            self._samples.pop(uid, None)
+        else:
+            self.record(uid, deadline)
+
+    def retain(self, uids: Iterable[int]) -> None:
+        """Drop the history of every miner not in `uids`."""
+
+        live = set(uids)
+        for uid in self._samples.keys() - live:
+            del self._samples[uid]
+
+    def percentile(self, uid: int, q: float) -> float | None:
+        samples = self._samples.get(uid)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+        return ordered[rank]
+
+    def deadline(self, uid: int, ceiling: float) -> float:
+        """
+        The time budget for the next call to a miner.
+
+        Args:
+            uid: The miner uid.
+            ceiling: The largest allowed budget, i.e. the configured call timeout.
+
+        Returns:
+            The adaptive deadline, or `ceiling` while the miner has too few samples.
+        """
+
+        p95 = self.percentile(uid, 95)
+        if p95 is None:
+            return ceiling
+        return min(ceiling, max(self.floor, p95 * self.margin))
+
+    def hedge_delay(self, uid: int, deadline: float) -> float | None:
+        """
+        When to send a hedged duplicate of a call, if at all.
+
+        Only miners that usually answer fast are hedged: the duplicate goes
+        out once the call has run past the miner's p90, provided that leaves
+        at least half of the deadline for the duplicate.
+
+        Returns:
+            The delay in seconds, or None if the call should not be hedged.
+        """
+
+        p90 = self.percentile(uid, 90)
+        if p90 is None or p90 > deadline / 2:
+            return None
+        return p90
+
+    def stats(self) -> dict[int, dict[str, float]]:
+        """Per-miner sample count and latency percentiles, for operators."""
+
+        stats = {}
+        for uid, samples in self._samples.items():
+            entry: dict[str, float] = {"samples": len(samples)}
+            for q in PERCENTILES:
+                value = self.percentile(uid, q)
+                if value is not None:
+                    entry[f"p{q}"] = round(value, 3)
+            stats[uid] = entry
+        return stats
+
+    def dump(self, path: str | Path) -> None:
+        """Write `stats` to a JSON file, replacing it atomically."""
+
+        path = Path(path)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(self.stats(), indent=2, sort_keys=True))
+        tmp_path.replace(path)
@@ -0,0 +1,197 @@
+"""
+A local stand-in for the MarketCompass backend API.
+
+It serves the `/subnet/*` endpoints the validators use, with deterministic
+prompts and scores, so validator flows can be exercised without the real
+backend:
+
+    python -m utils.local_backend --port 8080
+    export MC_SUBNET_API_URL=http://127.0.0.1:8080
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_QUERIES = ["bitcoin", "ethereum", "solana", "commune ai", "market compass"]
+# the longest a voting watch is held, whatever the client asks for
+MAX_WATCH = 60
+
+
+class LocalBackend:
+    """
+    In-process fake of the backend, served on a background thread.
+
+    Scores are `min(len(tweets) / max_results, 1)` for every registered
+    answer, so tests can predict them from the content alone.
+    """
+
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 0,
+            queries: list[str] | None = None,
+            max_results: int = 50,
+    ) -> None:
+        self.queries = queries or DEFAULT_QUERIES
+        self.max_results = max_results
+        self.responses: list[dict[str, Any]] = []
+        self.latest_voting: dict[str, float] = {}
+        self.voting_version = 0
+        self._lock = threading.Lock()
+        self._voting_changed = threading.Condition(self._lock)
+        self._stopped = False
+        self._prompt_counter = 0
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "LocalBackend":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        with self._voting_changed:
+            # release the held voting watches
+            self._stopped = True
+            self._voting_changed.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "LocalBackend":
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def next_requests(self, count: int) -> list[dict[str, str]]:
+        with self._lock:
+            prompts = []
+            for _ in range(count):
+                self._prompt_counter += 1
+                query = self.queries[self._prompt_counter % len(self.queries)]
+                prompts.append({"promptId": str(self._prompt_counter), "query": query})
+            return prompts
+
+    def register_response(self, content: str, miner_id: str, prompt_id: str) -> float:
+        try:
+            tweets = json.loads(content)
+        except ValueError:
+            tweets = None
+        score = min(len(tweets) / self.max_results, 1.0) if isinstance(tweets, list) else 0.0
+        with self._lock:
+            self.responses.append(
+                {"minerId": miner_id, "promptId": prompt_id, "content": content, "score": score}
+            )
+        return score
+
+    def register_latest_voting(self, voting: dict[str, float]) -> None:
+        with self._lock:
+            if voting != self.latest_voting:
+                self.latest_voting = dict(voting)
+                self.voting_version += 1
+                self._voting_changed.notify_all()
+
+    def latest_voting_etag(self) -> str:
+        return f'"{self.voting_version}"'
+
+    def watch_latest_voting(self, etag: str | None, timeout: float) -> tuple[dict[str, float] | None, str]:
+        """
+        Wait up to `timeout` seconds for a voting whose ETag is not `etag`.
+
+        Returns:
+            The voting, or None if it did not change, and its ETag.
+        """
+
+        with self._voting_changed:
+            self._voting_changed.wait_for(
+                lambda: self.latest_voting_etag() != etag or self._stopped, min(timeout, MAX_WATCH)
+            )
+            current = self.latest_voting_etag()
+            return (dict(self.latest_voting) if current != etag else None), current
+
+
+def _make_handler(backend: LocalBackend) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            match url.path:
+                case "/subnet/getNextRequests" | "/subnet/getNextOpenRequests":
+                    count = int(query.get("count", ["1"])[0])
+                    self._send_json(backend.next_requests(count))
+                case "/subnet/getLatestVoting" | "/subnet/watchLatestVoting":
+                    # a plain fetch is a watch that does not wait
+                    timeout = float(query.get("timeout", ["0"])[0]) if url.path == "/subnet/watchLatestVoting" else 0
+                    voting, etag = backend.watch_latest_voting(self.headers.get("If-None-Match"), timeout)
+                    if voting is None:
+                        self._send_not_modified(etag)
+                    else:
+                        self._send_json(voting, {"ETag": etag})
+                case _:
+                    self.send_error(404)
+
+        def do_POST(self) -> None:
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            match url.path:
+                case "/subnet/registerResponse":
+                    form = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                    score = backend.register_response(
+                        form.get("content", ""), form.get("minerId", ""), form.get("promptId", "")
+                    )
+                    self._send_text(str(score))
+                case "/subnet/registerLatestVoting":
+                    backend.register_latest_voting(json.loads(body)["voting"])
+                    self._send_json(True)
+                case _:
+                    self.send_error(404)
+
+        def _send_json(self, payload: Any, headers: dict[str, str] | None = None) -> None:
+            self._send(json.dumps(payload).encode(), "application/json", headers)
+
+        def _send_text(self, text: str) -> None:
+            self._send(text.encode(), "text/plain")
+
+        def _send(self, body: bytes, content_type: str, headers: dict[str, str] | None = None) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_not_modified(self, etag: str) -> None:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in MarketCompass backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    backend = LocalBackend(args.host, args.port)
+    print(f"Serving local backend on {backend.url}")
+    backend.serve_forever()
@@ -0,0 +1,173 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Any, TextIO
+
+ROOT_LOGGER = "subnet"
+# pass as `extra` to let a record be sampled, see `Sampler`
+SAMPLED = {"sampled": True}
+
+# arguments of these types cannot change before the writer thread formats the record
+_IMMUTABLE = (str, int, float, bool, type(None), BaseException)
+
+_lock = threading.Lock()
+_listener: logging.handlers.QueueListener | None = None
+
+
+def _iso(created: float) -> str:
+    return datetime.datetime.fromtimestamp(created, tz=datetime.timezone.utc).isoformat()
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"[{_iso(record.created)}] {record.levelname} {record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": _iso(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class Sampler:
+    """
+    Keeps one in `every` records logged with `extra=SAMPLED`.
+
+    Records are counted per message template, so each kind of per-miner
+    line is thinned out on its own. Other records always pass.
+    """
+
+    def __init__(self, every: int = 1) -> None:
+        self.every = every
+        self._seen: dict[Any, int] = {}
+
+    def keep(self, msg: Any) -> bool:
+        if self.every <= 1:
+            return True
+        seen = self._seen.get(msg, 0)
+        self._seen[msg] = seen + 1
+        return seen % self.every == 0
+
+
+_sampler = Sampler()
+
+
+class SubnetLogger(logging.LoggerAdapter):
+    """
+    Logger of a subnet module.
+
+    The level and the sampling are checked before a record is created, so
+    a dropped call costs a couple of lookups.
+    """
+
+    def log(self, level: int, msg: Any, *args: Any, **kwargs: Any) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        if kwargs.get("extra") is SAMPLED and not _sampler.keep(msg):
+            return
+        self.logger.log(level, msg, *args, **kwargs)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the base class formats every record on the calling thread; only do
+        # it when an argument could be mutated before the writer gets to it
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def configure_logging(
+        level: str | int | None = None,
+        json_lines: bool | None = None,
+        sample_every: int | None = None,
+        stream: TextIO | None = None,
+) -> None:
+    """
+    Route the subnet loggers through a queue to a background writer thread.
+
+    Logging calls only check the level, apply the sampling and queue the
+    record; formatting and writing happen on the writer thread. The queue
+    is drained at exit. Calling it again replaces the previous setup.
+    Entry points call it once at startup; until then, subnet records go to
+    the standard `logging` handlers.
+
+    Records are not given the caller location, thread or process, which
+    none of the formats print and which cost more than the rest of a
+    logging call to collect, see the optimization notes of the logging
+    HOWTO.
+
+    Args:
+        level: The minimum level, `MC_LOG_LEVEL` or INFO by default.
+        json_lines: Write one JSON object per record instead of text lines,
+            `MC_LOG_FORMAT=json` by default.
+        sample_every: Keep one in this many sampled records, see `Sampler`,
+            `MC_LOG_SAMPLE_EVERY` or 1 by default.
+        stream: Where to write, stdout by default.
+    """
+
+    global _listener, _sampler
+
+    if level is None:
+        level = os.getenv("MC_LOG_LEVEL", "INFO").upper()
+    if json_lines is None:
+        json_lines = os.getenv("MC_LOG_FORMAT", "text").lower() == "json"
+    if sample_every is None:
+        sample_every = int(os.getenv("MC_LOG_SAMPLE_EVERY", "1"))
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter() if json_lines else TextFormatter())
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    handler = _LazyQueueHandler(records)
+
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        root = logging.getLogger(ROOT_LOGGER)
+        for old_handler in list(root.handlers):
+            root.removeHandler(old_handler)
+        root.addHandler(handler)
+        root.setLevel(level)
+        root.propagate = False
+        _sampler = Sampler(sample_every)
+        _listener = logging.handlers.QueueListener(records, writer)
+        _listener.start()
+
+
+def get_logger(name: str) -> SubnetLogger:
+    """The logger of a module, below the `subnet` logger whatever the import path."""
+
+    return SubnetLogger(logging.getLogger(ROOT_LOGGER).getChild(name.removeprefix(f"{ROOT_LOGGER}.")))
+
+
+@atexit.register
+def _flush() -> None:
+    global _listener
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
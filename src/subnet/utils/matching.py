@@ -0,0 +1,110 @@
+import html
+import re
+import unicodedata
+from typing import Any, Hashable, Iterable, Mapping, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+_INVISIBLE = re.compile("[\u200b-\u200d\u2060\ufeff]")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form of a tweet text for matching.
+
+    HTML entities are unescaped (`&amp;` and `&` match), the text is NFKC
+    normalized, zero-width characters are dropped and runs of whitespace
+    collapse to one space.
+    """
+
+    if "&" in text:
+        text = html.unescape(text)
+    if not text.isascii():
+        text = _INVISIBLE.sub("", unicodedata.normalize("NFKC", text))
+    return " ".join(text.split())
+
+
+def text_key(text: str) -> int:
+    return hash(normalize_text(text))
+
+
+class GroundTruth:
+    """
+    Tweets fetched from the Twitter API, indexed for matching miner answers.
+
+    A ground truth tweet is found in an answer when a tweet with the same
+    id and the same text is there, or failing that, a tweet with the same
+    text and an id that is not in the ground truth. Texts are compared
+    after `normalize_text`. Every lookup is a hash probe, so matching an
+    answer costs O(n + m) instead of comparing every pair of texts, and
+    texts are only normalized when they differ as sent. One instance can
+    score any number of answers to the same query.
+    """
+
+    def __init__(self, tweets: Iterable[Mapping[str, Any]]) -> None:
+        self._tweets: list[tuple[str | None, str | None]] = []
+        for tweet in tweets:
+            tweet_id = tweet.get("id")
+            text = tweet.get("text")
+            self._tweets.append((
+                str(tweet_id) if tweet_id is not None else None,
+                text if isinstance(text, str) else None,
+            ))
+        self._texts_by_id = {tweet_id: text for tweet_id, text in self._tweets if tweet_id is not None}
+        self._text_keys: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._tweets)
+
+    def match(self, answer: Iterable[Any]) -> float:
+        """
+        Args:
+            answer: The tweets a miner returned.
+
+        Returns:
+            The percentage (0 to 100) of the ground truth found in `answer`.
+        """
+
+        if not self._tweets or not answer:
+            return 0
+        answer = [tweet for tweet in answer if isinstance(tweet, dict)]
+
+        # ids are compared as the strings the API returns them as; an answer
+        # tweet with a ground truth id only stands for that tweet
+        texts_by_id = self._texts_by_id
+        found = set()
+        texts = set()
+        for tweet in answer:
+            tweet_id = tweet.get("id")
+            text = tweet.get("text")
+            if tweet_id in texts_by_id:
+                truth = texts_by_id[tweet_id]
+                if truth == text or tweet_id not in found and self._same_text(truth, text):
+                    found.add(tweet_id)
+            elif isinstance(text, str):
+                texts.add(text)
+
+        missing = [text for tweet_id, text in self._tweets if tweet_id not in found]
+        if missing and texts:
+            missing = [text for text in missing if text not in texts]
+            if missing:
+                keys = {text_key(text) for text in texts}
+                missing = [text for text in missing if text is None or self._text_key(text) not in keys]
+        return (len(self._tweets) - len(missing)) / len(self._tweets) * 100
+
+    def match_batch(self, answers: Mapping[K, Iterable[Any]]) -> dict[K, float]:
+        """Match the answers of several miners, keyed by miner."""
+
+        return {miner: self.match(answer) for miner, answer in answers.items()}
+
+    def _same_text(self, text: str | None, other: Any) -> bool:
+        # a ground truth tweet without a text can only be told by its id
+        if text is None:
+            return True
+        return isinstance(other, str) and self._text_key(text) == text_key(other)
+
+    def _text_key(self, text: str) -> int:
+        key = self._text_keys.get(text)
+        if key is None:
+            key = self._text_keys[text] = text_key(text)
+        return key
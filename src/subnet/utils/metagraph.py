@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from communex.client import CommuneClient  # type: ignore
+from communex.types import Ss58Address  # type: ignore
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+IP_REGEX = re.compile(r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+")
+
+NETUID_CACHE_PATH = Path(os.getenv("MC_CACHE_DIR", "~/.cache/market-compass")).expanduser() / "netuids.json"
+NETUID_CACHE_MAX_AGE = 24 * 60 * 60
+
+
+def extract_address(string: str):
+    return re.search(IP_REGEX, string)
+
+
+def get_subnet_netuid(clinet: CommuneClient, subnet_name: str = "market-compass", node_url: str | None = None):
+    """
+    Retrieve the network UID of the subnet.
+
+    When `node_url` is given, the answer is kept on disk for a day under
+    the node and subnet name, so restarts skip the `query_map_subnet_names`
+    chain query. A kept netuid is only used once the chain confirms it
+    still names the subnet, which is a single storage query.
+
+    Args:
+        client: The CommuneX client.
+        subnet_name: The name of the subnet (default: "market-compass").
+        node_url: The URL of the node `client` is connected to.
+
+    Returns:
+        The network UID of the subnet.
+
+    Raises:
+        ValueError: If the subnet is not found.
+    """
+
+    cached = _read_netuid_cache() if node_url else {}
+    entries = cached.setdefault(node_url, {})
+    entry = entries.get(subnet_name)
+    if entry and time.time() - entry["saved_at"] < NETUID_CACHE_MAX_AGE:
+        try:
+            if clinet.get_subnet_name(entry["netuid"]) == subnet_name:
+                return entry["netuid"]
+        except Exception as e:
+            logger.warning("Could not check the cached netuid %s: %s", entry["netuid"], e)
+        else:
+            logger.info("Subnet %s is no longer netuid %s", subnet_name, entry["netuid"])
+
+    subnets = clinet.query_map_subnet_names()
+    for netuid, name in subnets.items():
+        if name == subnet_name:
+            if node_url:
+                entries[subnet_name] = {"netuid": netuid, "saved_at": time.time()}
+                _write_netuid_cache(cached)
+            return netuid
+    raise ValueError(f"Subnet {subnet_name} not found")
+
+
+def _read_netuid_cache() -> dict[str, Any]:
+    try:
+        return json.loads(NETUID_CACHE_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_netuid_cache(cached: dict[str, Any]) -> None:
+    try:
+        NETUID_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        NETUID_CACHE_PATH.write_text(json.dumps(cached))
+    except OSError as e:
+        logger.warning("Could not write the netuid cache: %s", e)
+
+
+@dataclass(frozen=True)
+class MetagraphSnapshot:
+    """An immutable view of the subnet modules at a given block."""
+
+    block: int
+    addresses: Mapping[int, str]
+    keys: Mapping[int, Ss58Address]
+    ip_ports: Mapping[int, tuple[str, str]]
+
+
+class MetagraphCache:
+    """
+    Block-aware cache of the subnet address and key maps.
+
+    `snapshot` returns the cached snapshot straight away and refreshes it in
+    the background, so `validate_step` does not wait on the chain map
+    queries. The maps are only re-queried once the chain has moved at least
+    `max_block_lag` blocks past the snapshot, and addresses that did not
+    change are not parsed again.
+    """
+
+    def __init__(self, client: CommuneClient, netuid: int, max_block_lag: int = 5) -> None:
+        self.client = client
+        self.netuid = netuid
+        self.max_block_lag = max_block_lag
+        self._snapshot: MetagraphSnapshot | None = None
+        self._parsed: dict[str, tuple[str, str] | None] = {}
+        self._refresh_task: asyncio.Task | None = None
+
+    async def snapshot(self) -> MetagraphSnapshot:
+        """
+        Return the latest snapshot, scheduling a background refresh.
+
+        Only the very first call waits for the chain.
+        """
+
+        if self._snapshot is None:
+            await self.refresh()
+        elif self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+        assert self._snapshot is not None
+        return self._snapshot
+
+    async def refresh(self) -> MetagraphSnapshot:
+        """Bring the snapshot up to date with the chain."""
+
+        block = await asyncio.to_thread(self._current_block)
+        if self._snapshot is not None and block - self._snapshot.block < self.max_block_lag:
+            return self._snapshot
+
+        addresses, keys = await asyncio.gather(
+            asyncio.to_thread(self.client.query_map_address, self.netuid),
+            asyncio.to_thread(self.client.query_map_key, self.netuid),
+        )
+        self._snapshot = MetagraphSnapshot(
+            block=block,
+            addresses=MappingProxyType(dict(addresses)),
+            keys=MappingProxyType(dict(keys)),
+            ip_ports=MappingProxyType(self._parse_addresses(addresses)),
+        )
+        return self._snapshot
+
+    async def _background_refresh(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning("Metagraph refresh failed, keeping the snapshot from block %s: %s", self._snapshot.block, e)
+
+    def _current_block(self) -> int:
+        block = self.client.get_block()
+        return int(block["header"]["number"])
+
+    def _parse_addresses(self, addresses: dict[int, str]) -> dict[int, tuple[str, str]]:
+        parsed: dict[str, tuple[str, str] | None] = {}
+        ip_ports: dict[int, tuple[str, str]] = {}
+        for uid, address in addresses.items():
+            if address in self._parsed:
+                ip_port = self._parsed[address]
+            else:
+                match = extract_address(address)
+                ip_port = tuple(match.group(0).split(":")) if match is not None else None
+            parsed[address] = ip_port
+            if ip_port is not None:
+                ip_ports[uid] = ip_port
+        self._parsed = parsed
+        return ip_ports
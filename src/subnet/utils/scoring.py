@@ -0,0 +1,66 @@
+import asyncio
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# (miner uid, prompt id or prompt, miner answer)
+Submission = tuple[int, str, Any]
+
+
+class ScoringClient:
+    """
+    Score many miner answers at once.
+
+    `scorer` is called as `scorer(content, miner_id, prompt)`, e.g. the
+    backend registration of the validator or the Twitter spot check of the
+    selfvalidator. Submissions are scored concurrently, at most
+    `max_concurrency` at a time, and each one starts as soon as it is
+    produced, so scoring overlaps with the miners that are still answering.
+    """
+
+    def __init__(
+            self,
+            scorer: Callable[[Any, int, str], Awaitable[float]],
+            max_concurrency: int = 32,
+    ) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.scorer = scorer
+        self.max_concurrency = max_concurrency
+
+    async def score(self, submissions: Iterable[Submission] | AsyncIterable[Submission]) -> dict[int, float]:
+        """
+        Score answers as they arrive and collect the results.
+
+        Args:
+            submissions: (miner uid, prompt, content) tuples, either as a
+                plain iterable or as an async iterable that yields them as
+                the miners answer.
+
+        Returns:
+            A dictionary mapping miner uids to their scores. Miners whose
+            scoring failed are left out.
+        """
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def submit(submission: Submission) -> tuple[int, float | None]:
+            miner_id, prompt, content = submission
+            async with semaphore:
+                try:
+                    return miner_id, await self.scorer(content, miner_id, prompt)
+                except Exception as e:
+                    logger.warning("Failed to score the answer of miner %s: %s", miner_id, e)
+                    return miner_id, None
+
+        tasks = []
+        if isinstance(submissions, AsyncIterable):
+            async for submission in submissions:
+                tasks.append(asyncio.create_task(submit(submission)))
+        else:
+            tasks = [asyncio.create_task(submit(submission)) for submission in submissions]
+
+        results = await asyncio.gather(*tasks)
+        return {miner_id: score for miner_id, score in results if score is not None}
@@ -1,6 +1,10 @@
-from typing import Literal, Any
+from typing import Any
 import datetime
 
+from .logger import get_logger
+
+_logger = get_logger(__name__)
+
 
 def iso_timestamp_now() -> str:
     now = datetime.datetime.now(tz=datetime.timezone.utc)
@@ -12,15 +16,15 @@ def log(
     msg: str,
     *values: object,
     sep: str | None = " ",
-    end: str | None = "\n",
-    file: Any | None = None,
-    flush: Literal[False] = False,
+    **_: Any,
 ):
-    print(
-        f"[{iso_timestamp_now()}] " + msg,
-        *values,
-        sep=sep,
-        end=end,
-        file=file,
-        flush=flush,
-    )
+    """
+    Log an info line; kept for old callers, new code uses `utils.logger.get_logger`.
+
+    The print-style `end`, `file` and `flush` arguments are accepted and
+    ignored, the configured logging output applies.
+    """
+
+    if values:
+        msg = (sep if sep is not None else " ").join([msg, *map(str, values)])
+    _logger.info(msg)
@@ -0,0 +1,130 @@
+from typing import Any, Mapping
+
+import numpy as np
+from communex.client import CommuneClient  # type: ignore
+from substrateinterface import Keypair  # type: ignore
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+WEIGHT_SCALE = 10000
+
+
+def compute_weights(
+        score_dict: Mapping[Any, float],
+        max_allowed_weights: int,
+        scale: int = WEIGHT_SCALE,
+) -> tuple[list[int], list[int]]:
+    """
+    Turn miner scores into the integer weights sent to the chain.
+
+    Only the `max_allowed_weights` best scores are kept; they are picked
+    with a partial selection instead of a full sort, ties going to the lower
+    uid. NaN, infinite and negative scores count as zero. The kept scores
+    are normalized with the largest remainder method, so the weights add up
+    to exactly `scale` and each one is within 1 of its exact share.
+
+    Args:
+        score_dict: A dictionary mapping uids (int or numeric str) to scores.
+        max_allowed_weights: The maximum number of uids to vote for.
+        scale: The total of the returned weights.
+
+    Returns:
+        The uids and their weights, ordered by uid, without zero weights.
+        Both lists are empty when no score is positive.
+    """
+
+    count = len(score_dict)
+    if count == 0 or max_allowed_weights <= 0:
+        return [], []
+
+    uids = np.fromiter((int(uid) for uid in score_dict.keys()), dtype=np.int64, count=count)
+    scores = np.fromiter(score_dict.values(), dtype=np.float64, count=count)
+    scores[~np.isfinite(scores) | (scores < 0)] = 0.0
+
+    if max_allowed_weights < count:
+        selected = _top_k(uids, scores, max_allowed_weights)
+        uids, scores = uids[selected], scores[selected]
+
+    peak = scores.max()
+    if peak <= 0:
+        return [], []
+    # relative to the best score, the sum cannot overflow nor vanish in denormals
+    scores = scores / peak
+    total = scores.sum()
+
+    shares = scores * (scale / total)
+    weights = np.floor(shares).astype(np.int64)
+    missing = scale - int(weights.sum())
+    if missing > 0:
+        # hand the rounding leftovers to the largest fractional parts
+        order = np.lexsort((uids, -(shares - weights)))
+        weights[order[:missing]] += 1
+
+    keep = weights > 0
+    uids, weights = uids[keep], weights[keep]
+    order = np.argsort(uids, kind="stable")
+    return uids[order].tolist(), weights[order].tolist()
+
+
+def weight_change(
+        old: tuple[list[int], list[int]],
+        new: tuple[list[int], list[int]],
+) -> float:
+    """
+    How far apart two votes are, from 0 (same shares) to 1 (disjoint).
+
+    Both votes, as returned by `compute_weights`, are normalized to shares
+    of their total and compared by total variation distance, half the L1
+    distance over every uid in either vote. An empty vote is at distance 1
+    from any other vote and 0 from another empty one.
+    """
+
+    old_shares = _shares(*old)
+    new_shares = _shares(*new)
+    if not old_shares or not new_shares:
+        return float(bool(old_shares) != bool(new_shares))
+    return sum(
+        abs(old_shares.get(uid, 0.0) - new_shares.get(uid, 0.0)) for uid in old_shares.keys() | new_shares.keys()
+    ) / 2
+
+
+def _shares(uids: list[int], weights: list[int]) -> dict[int, float]:
+    total = sum(weights)
+    return {uid: weight / total for uid, weight in zip(uids, weights)} if total > 0 else {}
+
+
+def _top_k(uids: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    kth_score = np.partition(scores, scores.size - k)[scores.size - k]
+    above = np.flatnonzero(scores > kth_score)
+    tied = np.flatnonzero(scores == kth_score)
+    tied = tied[np.argsort(uids[tied], kind="stable")][: k - above.size]
+    return np.concatenate((above, tied))
+
+
+def set_weights(
+        settings: Any,
+        score_dict: Mapping[Any, float],
+        netuid: int,
+        client: CommuneClient,
+        key: Keypair,
+) -> None:
+    """
+    Normalize the scores and send them to the chain as weights.
+
+    Args:
+        settings: Validator settings providing `max_allowed_weights`.
+        score_dict: A dictionary mapping uids to scores.
+        netuid: The subnet to vote on.
+        client: The CommuneX client.
+        key: The validator key.
+    """
+
+    uids, weights = compute_weights(score_dict, settings.max_allowed_weights)
+    if not uids:
+        logger.info("No positive scores, skipping the vote")
+        return
+
+    # send the blockchain call
+    client.vote(key=key, uids=uids, weights=weights, netuid=netuid)
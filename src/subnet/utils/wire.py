@@ -0,0 +1,256 @@
+import base64
+import functools
+import json
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from .connections import MinerStatusError
+
+COLUMNAR = "mc-columnar-zlib/1"
+
+_MAGIC = b"MCT1"
+_HEADER = struct.Struct("<4sI")
+_COLUMNS = ("id", "author_id", "created_at", "text")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_U64_MAX = 2 ** 64 - 1
+
+# validators ask for one search page, at most 100 tweets
+MAX_TWEETS = 100
+# the id, author id, time and text end columns, a 280 character text with
+# every character escaped or 4 bytes long, and its extra fields
+MAX_TWEET_BYTES = 4096
+
+
+def _to_ms(created_at: str) -> int | None:
+    # only the exact format the search API returns survives the round trip
+    try:
+        parsed = datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+    ms = (parsed - _EPOCH) // timedelta(milliseconds=1)
+    return ms if _from_ms(ms) == created_at else None
+
+
+@functools.lru_cache(maxsize=64)
+def _day_prefix(day: int) -> str:
+    return time.strftime("%Y-%m-%dT", time.gmtime(day * 86400))
+
+
+def _from_ms(ms: int) -> str:
+    # a batch spans a few days at most, so only the time of day is formatted per tweet
+    day, ms = divmod(ms, 86_400_000)
+    seconds, millis = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{_day_prefix(day)}{hours:02d}:{minutes:02d}:{seconds:02d}.{millis:03d}Z"
+
+
+def _to_u64(value: Any) -> int | None:
+    if not isinstance(value, str) or not value.isdigit() or value != str(int(value)):
+        return None
+    number = int(value)
+    return number if number <= _U64_MAX else None
+
+
+def _column(typecode: str, values: list[int]) -> bytes:
+    column = array(typecode, values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+def _view(buffer: memoryview, typecode: str, offset: int, count: int) -> tuple[Any, int]:
+    end = offset + count * 8 if typecode in "Qq" else offset + count * 4
+    if sys.byteorder == "little":
+        # no copy, the column is read straight from the decompressed buffer
+        return buffer[offset:end].cast(typecode), end
+    column = array(typecode, buffer[offset:end])
+    column.byteswap()
+    return column, end
+
+
+def encode_tweets(tweets: list[dict], encoding: str | None = COLUMNAR) -> list[dict] | dict:
+    """
+    Encode a search answer for the wire.
+
+    The columnar encoding stores ids, author ids and creation times as
+    64-bit integers and all texts as one UTF-8 buffer, then compresses the
+    whole batch. Any other tweet field is kept as JSON next to the columns.
+    Answers the columns cannot represent exactly are returned unchanged.
+
+    Args:
+        tweets: The tweets to send.
+        encoding: The encoding the caller asked for, or None for plain JSON.
+
+    Returns:
+        The encoded answer, or `tweets` itself when it is sent as plain JSON.
+    """
+
+    if encoding != COLUMNAR or not isinstance(tweets, list):
+        return tweets
+
+    ids, author_ids, created, text_ends, extras = [], [], [], [], []
+    texts = bytearray()
+    for tweet in tweets:
+        if not isinstance(tweet, dict) or not isinstance(tweet.get("text"), str):
+            return tweets
+        tweet_id = _to_u64(tweet.get("id"))
+        author_id = _to_u64(tweet.get("author_id"))
+        created_ms = _to_ms(tweet.get("created_at"))
+        if tweet_id is None or author_id is None or created_ms is None:
+            return tweets
+        ids.append(tweet_id)
+        author_ids.append(author_id)
+        created.append(created_ms)
+        texts += tweet["text"].encode()
+        text_ends.append(len(texts))
+        extras.append({k: v for k, v in tweet.items() if k not in _COLUMNS})
+
+    payload = b"".join((
+        _HEADER.pack(_MAGIC, len(tweets)),
+        _column("Q", ids),
+        _column("Q", author_ids),
+        _column("q", created),
+        _column("I", text_ends),
+        bytes(texts),
+        json.dumps(extras, separators=(",", ":")).encode() if any(extras) else b"",
+    ))
+    return {"encoding": COLUMNAR, "data": base64.b64encode(zlib.compress(payload)).decode()}
+
+
+def decode_tweets(answer: Any, max_tweets: int = MAX_TWEETS) -> Any:
+    """
+    Decode a miner answer encoded by `encode_tweets`.
+
+    Plain JSON answers, from miners that do not support the encoding, are
+    returned as they are. The answer is never decompressed past what
+    `max_tweets` tweets can take, so a small answer cannot expand into a
+    large buffer.
+
+    Args:
+        answer: The answer as received.
+        max_tweets: The most tweets the answer may hold.
+
+    Raises:
+        ValueError: If the answer claims an encoding it does not follow, or
+            holds more than `max_tweets` tweets.
+    """
+
+    if not isinstance(answer, dict) or "encoding" not in answer:
+        return answer
+    if answer["encoding"] != COLUMNAR:
+        raise ValueError(f"Unknown answer encoding: {answer['encoding']}")
+
+    max_decoded = _HEADER.size + max_tweets * MAX_TWEET_BYTES
+    try:
+        inflater = zlib.decompressobj()
+        buffer = memoryview(inflater.decompress(base64.b64decode(answer["data"]), max_decoded))
+        if inflater.unconsumed_tail:
+            raise ValueError(f"over {max_decoded} bytes decompressed")
+        if not inflater.eof:
+            raise ValueError("truncated data")
+        magic, count = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError("bad magic")
+        if count > max_tweets:
+            raise ValueError(f"{count} tweets, at most {max_tweets} expected")
+        ids, offset = _view(buffer, "Q", _HEADER.size, count)
+        author_ids, offset = _view(buffer, "Q", offset, count)
+        created, offset = _view(buffer, "q", offset, count)
+        text_ends, offset = _view(buffer, "I", offset, count)
+        text_end = offset + (text_ends[-1] if count else 0)
+        extras = json.loads(bytes(buffer[text_end:])) if len(buffer) > text_end else [{}] * count
+
+        tweets = []
+        text_start = offset
+        for i in range(count):
+            tweet = {
+                "id": str(ids[i]),
+                "author_id": str(author_ids[i]),
+                "created_at": _from_ms(created[i]),
+                "text": str(buffer[text_start:offset + text_ends[i]], "utf-8"),
+            }
+            tweet.update(extras[i])
+            tweets.append(tweet)
+            text_start = offset + text_ends[i]
+    except (KeyError, IndexError, TypeError, struct.error, zlib.error, ValueError) as e:
+        raise ValueError(f"Malformed {COLUMNAR} answer: {e}") from e
+    return tweets
+
+
+def rejects_encoding(error: MinerStatusError) -> bool:
+    """
+    Whether a miner refused a call because it does not know `encoding`.
+
+    Older miners answer the unknown parameter with a validation error or
+    an unexpected keyword argument error naming it. Rate limiting, miner
+    side failures and errors that do not name the parameter are not a
+    rejection.
+    """
+
+    return error.status >= 400 and error.status != 429 and "encoding" in error.body
+
+
+class EncodingNegotiator:
+    """
+    Asks every miner for the columnar encoding, falling back to JSON.
+
+    Miners that predate the encoding reject the unknown `encoding`
+    parameter. Those are asked again in plain JSON right away and are
+    remembered as such for `retry_after` seconds, after which they are
+    probed again in case they upgraded.
+    """
+
+    def __init__(self, retry_after: float = 3600, clock: Callable[[], float] = time.monotonic) -> None:
+        self.retry_after = retry_after
+        self.clock = clock
+        self._legacy: dict[str, float] = {}
+
+    def supports(self, miner_key: str) -> bool:
+        marked_at = self._legacy.get(miner_key)
+        if marked_at is None:
+            return True
+        if self.clock() - marked_at >= self.retry_after:
+            del self._legacy[miner_key]
+            return True
+        return False
+
+    async def call(
+            self,
+            send: Callable[[dict, float], Awaitable[Any]],
+            miner_key: str,
+            params: dict,
+            timeout: float,
+    ) -> Any:
+        """
+        Call a miner endpoint in the best encoding the miner supports.
+
+        Args:
+            send: Coroutine function sending the call with the given
+                parameters and timeout.
+            miner_key: The ss58 address of the miner.
+            params: The call parameters, without `encoding`.
+            timeout: The time budget of the call, retries included.
+
+        Returns:
+            The decoded answer.
+        """
+
+        if not self.supports(miner_key):
+            return decode_tweets(await send(params, timeout))
+
+        started = self.clock()
+        try:
+            answer = await send({**params, "encoding": COLUMNAR}, timeout)
+        except MinerStatusError as e:
+            if not rejects_encoding(e):
+                raise
+            answer = await send(params, max(timeout - (self.clock() - started), 0.1))
+            # only a miner that answers without the parameter is known not to support it
+            self._legacy[miner_key] = self.clock()
+        return decode_tweets(answer)
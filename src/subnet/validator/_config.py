@@ -4,3 +4,8 @@ class ValidatorSettings(BaseSettings):
     subnet_name: str = 'market-compass'
     iteration_interval: int = 60  # Set, accordingly to your tempo.
     max_allowed_weights: int = 400  # Query dynamically based on your subnet settings.
+    max_concurrent_queries: int = 256  # Upper bound on miner calls in flight at once.
+    max_concurrent_scoring: int = 32  # Upper bound on backend score registrations in flight at once.
+    pipelined: bool = False  # Overlap each step's vote submission with the next step.
+    max_steps_in_flight: int = 2  # Steps started but not yet submitted, when pipelined.
+    latency_stats_path: str | None = None  # Where to write per-miner latency percentiles each step.
@@ -1,111 +1,26 @@
 import asyncio
-import concurrent.futures
 import json
 import os
-import re
 import time
-import requests
 from functools import partial
 
 from communex.client import CommuneClient  # type: ignore
-from communex.module.client import ModuleClient  # type: ignore
 from communex.module.module import Module  # type: ignore
 from communex.types import Ss58Address  # type: ignore
 from substrateinterface import Keypair  # type: ignore
 
 from ._config import ValidatorSettings
-from utils.utils import log
+from utils.backend import BackendClient
+from utils.connections import MinerConnectionPool, MinerTimeoutError
+from utils.dispatch import MinerDispatcher, hedged
+from utils.latency import LatencyTracker
+from utils.logger import SAMPLED, get_logger
+from utils.metagraph import MetagraphCache, get_subnet_netuid
+from utils.scoring import ScoringClient
+from utils.weights import set_weights
+from utils.wire import EncodingNegotiator
 
-IP_REGEX = re.compile(r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+")
-
-def set_weights(
-        settings: ValidatorSettings,
-        score_dict: dict[
-            int, float
-        ],
-        netuid: int,
-        client: CommuneClient,
-        key: Keypair,
-) -> None:
-    # you can replace with `max_allowed_weights` with the amount your subnet allows
-    score_dict = cut_to_max_allowed_weights(score_dict, settings.max_allowed_weights)
-
-    # Create a new dictionary to store the weighted scores
-    weighted_scores: dict[int, int] = {}
-
-    # Calculate the sum of all inverted scores
-    scores = sum(score_dict.values())
-
-    # process the scores into weights of type dict[int, int]
-    # Iterate over the items in the score_dict
-    for uid, score in score_dict.items():
-        # Calculate the normalized weight as an integer
-        weight = int(score / scores * 10000)
-
-        # Add the weighted score to the new dictionary
-        weighted_scores[uid] = weight
-
-    # filter out 0 weights
-    weighted_scores = {k: v for k, v in weighted_scores.items() if v != 0}
-
-    uids = list(weighted_scores.keys())
-    weights = list(weighted_scores.values())
-    # send the blockchain call
-    client.vote(key=key, uids=uids, weights=weights, netuid=netuid)
-
-
-def cut_to_max_allowed_weights(
-        score_dict: dict[int, float], max_allowed_weights: int
-) -> dict[int, float]:
-    sorted_scores = sorted(score_dict.items(), key=lambda x: x[1], reverse=True)
-
-    cut_scores = sorted_scores[:max_allowed_weights]
-
-    return dict(cut_scores)
-
-
-def extract_address(string: str):
-    return re.search(IP_REGEX, string)
-
-
-def get_subnet_netuid(clinet: CommuneClient, subnet_name: str = "market-compass"):
-    """
-    Retrieve the network UID of the subnet.
-
-    Args:
-        client: The CommuneX client.
-        subnet_name: The name of the subnet (default: "foo").
-
-    Returns:
-        The network UID of the subnet.
-
-    Raises:
-        ValueError: If the subnet is not found.
-    """
-
-    subnets = clinet.query_map_subnet_names()
-    for netuid, name in subnets.items():
-        if name == subnet_name:
-            return netuid
-    raise ValueError(f"Subnet {subnet_name} not found")
-
-
-def get_ip_port(modules_adresses: dict[int, str]):
-    """
-    Get the IP and port information from module addresses.
-
-    Args:
-        modules_addresses: A dictionary mapping module IDs to their addresses.
-
-    Returns:
-        A dictionary mapping module IDs to their IP and port information.
-    """
-
-    filtered_addr = {id: extract_address(addr) for id, addr in modules_adresses.items()}
-    ip_port = {
-        id: x.group(0).split(":") for id, x in filtered_addr.items() if x is not None
-    }
-    return ip_port
+logger = get_logger(__name__)
 
 
 class TwitterValidator(Module):
@@ -115,6 +30,7 @@ class TwitterValidator(Module):
             netuid: int,
             client: CommuneClient,
             call_timeout: int = 60,
+            hedge_requests: bool = False,
 
     ) -> None:
         super().__init__()
@@ -122,101 +38,101 @@ class TwitterValidator(Module):
         self.key = key
         self.netuid = netuid
         self.call_timeout = call_timeout
+        self.hedge_requests = hedge_requests
+        self.latency = LatencyTracker()
+        self.connection_pool = MinerConnectionPool(key)
+        self.wire = EncodingNegotiator()
+        self.metagraph = MetagraphCache(client, netuid)
         self.mc_subnet_api_x_api_key = os.getenv('MC_SUBNET_API_X_API_KEY')
         self.mc_subnet_url = os.getenv('MC_SUBNET_API_URL')
+        self.backend = BackendClient(self.mc_subnet_url, self.mc_subnet_api_x_api_key)
 
-    def get_addresses(self, client: CommuneClient, netuid: int) -> dict[int, str]:
-        """
-        Retrieve all module addresses from the subnet.
-
-        Args:
-            client: The CommuneClient instance used to query the subnet.
-            netuid: The unique identifier of the subnet.
-
-        Returns:
-            A dictionary mapping module IDs to their addresses.
-        """
-
-        # Makes a blockchain query for the miner addresses
-        module_addreses = client.query_map_address(netuid)
-        return module_addreses
-
-    def _get_miner_prediction(
+    async def _get_miner_prediction(
             self,
             all_prompts: list,
-            miner_info: tuple[int, tuple[list[str], Ss58Address]],
+            miner_info: tuple[int, tuple[int, tuple[tuple[str, str], Ss58Address]]],
     ) -> str | None:
-        miner_index, [connection, miner_key] = miner_info
+        miner_index, [uid, [connection, miner_key]] = miner_info
         module_ip, module_port = connection
-        client = ModuleClient(module_ip, int(module_port), self.key)
+        client = self.connection_pool.get(module_ip, int(module_port), miner_key)
         prompt = all_prompts[miner_index]['query']
 
-        try:
-            miner_answer = asyncio.run(
-                client.call(
-                    "generate",
-                    miner_key,
-                    {"prompt": prompt},
-                    timeout=self.call_timeout,  #  type: ignore
-                )
+        deadline = self.latency.deadline(uid, self.call_timeout)
+        hedge_delay = self.latency.hedge_delay(uid, deadline) if self.hedge_requests else None
+
+        async def send(params: dict, timeout: float):
+            return await client.call(
+                "generate",
+                miner_key,
+                params,
+                timeout=timeout,  #  type: ignore
             )
-            miner_answer = miner_answer
+
+        async def call(timeout: float):
+            return await self.wire.call(send, miner_key, {"prompt": prompt}, timeout)
+
+        started = time.monotonic()
+        try:
+            miner_answer = await hedged(call, deadline, hedge_delay)
+            self.latency.record(uid, time.monotonic() - started)
 
         except Exception as e:
-            log(f"Miner {module_ip}:{module_port} failed to generate an answer")
-            print(e)
+            if isinstance(e, MinerTimeoutError):
+                self.latency.timed_out(uid, deadline, self.call_timeout)
+            logger.info("Miner %s:%s failed to generate an answer: %s", module_ip, module_port, e, extra=SAMPLED)
             miner_answer = None
         return miner_answer
 
     async def get_prompts(self, count: int) -> list[str]:
-        response = requests.get(f'{self.mc_subnet_url}/subnet/getNextRequests?count={count}', headers={
-            'x-api-key': self.mc_subnet_api_x_api_key
-        })
+        response = await self.backend.request('GET', '/subnet/getNextRequests', params={'count': count})
         if response.ok:
             return response.json()
         raise Exception("cant get prompt")
 
     async def register_response_get_weight(self, content: str, miner_id: str, prompt_id: str) -> int:
-        response = requests.post(
-            f'{self.mc_subnet_url}/subnet/registerResponse',
+        response = await self.backend.request(
+            'POST',
+            '/subnet/registerResponse',
             data={
                 "content": json.dumps(content),
-                "minerId": miner_id,
-                "promptId": prompt_id
+                "minerId": str(miner_id),
+                "promptId": str(prompt_id)
             },
-            headers={
-                'x-api-key': self.mc_subnet_api_x_api_key
-            }
         )
         if response.ok:
-            return float(response.text)
+            return float(response.text())
         return 0
 
     async def register_latest_voting(self, voting_dict: dict[int, float]) -> bool:
         payload = {
             "voting": voting_dict
         }
-        response = requests.post(
-            f'{self.mc_subnet_url}/subnet/registerLatestVoting',
-            json=payload,
-            headers={
-                'x-api-key': self.mc_subnet_api_x_api_key
-            }
-        )
+        response = await self.backend.request('POST', '/subnet/registerLatestVoting', json_body=payload)
         return response.ok
 
-    async def validate_step(
-            self, syntia_netuid: int, settings: ValidatorSettings
-    ) -> None:
-        modules_adresses = self.get_addresses(self.client, syntia_netuid)
-        modules_keys = self.client.query_map_key(syntia_netuid)
+    async def prepare_step(
+            self, settings: ValidatorSettings
+    ) -> tuple[dict[int, tuple[tuple[str, str], Ss58Address]], list] | None:
+        """
+        Pick the miners to query and fetch their prompts.
+
+        Args:
+            settings: The validator settings.
+
+        Returns:
+            The miners to query and their prompts, or None if no prompts
+            could be fetched.
+        """
+
+        metagraph = await self.metagraph.snapshot()
+        modules_keys = metagraph.keys
         val_ss58 = self.key.ss58_address
         if val_ss58 not in modules_keys.values():
             raise RuntimeError(f"validator key {val_ss58} is not registered in subnet")
 
-        modules_info: dict[int, tuple[list[str], Ss58Address]] = {}
+        modules_info: dict[int, tuple[tuple[str, str], Ss58Address]] = {}
 
-        modules_filtered_address = get_ip_port(modules_adresses)
+        modules_filtered_address = metagraph.ip_ports
         for module_id in modules_keys.keys():
             module_addr = modules_filtered_address.get(module_id, None)
             if not module_addr:
@@ -224,49 +140,164 @@ class TwitterValidator(Module):
 
             modules_info[module_id] = (module_addr, modules_keys[module_id])
 
-        score_dict: dict[int, float] = {}
+        await self.connection_pool.sync(modules_info)
+        self.latency.retain(modules_info.keys())
 
-        log(f"Selected the following miners: {modules_info.keys()}")
+        logger.info("Selected the following miners: %s", list(modules_info))
 
         try:
             all_prompts = await self.get_prompts(len(modules_info.values()))
         except Exception as e:
-            print('problem with getting prompts', e)
-            return
+            logger.warning('Problem with getting prompts: %s', e)
+            return None
+
+        return modules_info, all_prompts
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=80) as executor:
-            get_miner_prediction = partial(self._get_miner_prediction, all_prompts)
-            it = executor.map(get_miner_prediction, enumerate(modules_info.values()))
-            miner_answers = [*it]
+    async def score_miners(
+            self,
+            modules_info: dict[int, tuple[tuple[str, str], Ss58Address]],
+            all_prompts: list,
+            settings: ValidatorSettings,
+    ) -> dict[int, float]:
+        """
+        Query the miners and score their answers with the backend.
 
-        for index, [mid, miner_response] in enumerate(zip(modules_info.keys(), miner_answers)):
-            miner_answer = miner_response
-            used_prompt_id = all_prompts[index]['promptId']
+        Args:
+            modules_info: The miners to query.
+            all_prompts: One prompt per miner, in the order of `modules_info`.
+            settings: The validator settings.
 
-            if not miner_answer:
-                log(f"Skipping miner {mid} that didn't answer")
-                continue
+        Returns:
+            A dictionary mapping miner uids to their scores.
+        """
 
-            score = await self.register_response_get_weight(miner_answer, mid, used_prompt_id)
-            print('score from backend. UID:', mid, score)
+        score_dict: dict[int, float] = {}
+
+        dispatcher = MinerDispatcher(settings.max_concurrent_queries)
+        get_miner_prediction = partial(self._get_miner_prediction, all_prompts)
+
+        async def answered_prompts():
+            # answers are handed to scoring as soon as each miner responds
+            async for (index, [mid, _]), miner_answer in dispatcher.as_completed(
+                    get_miner_prediction, enumerate(modules_info.items())
+            ):
+                if not miner_answer:
+                    logger.info("Skipping miner %s that didn't answer", mid, extra=SAMPLED)
+                    continue
+
+                yield mid, all_prompts[index]['promptId'], miner_answer
+
+        scoring_client = ScoringClient(self.register_response_get_weight, settings.max_concurrent_scoring)
+        backend_scores = await scoring_client.score(answered_prompts())
+        if settings.latency_stats_path:
+            self.latency.dump(settings.latency_stats_path)
+
+        for mid, score in backend_scores.items():
+            logger.info('Score from backend. UID: %s %s', mid, score, extra=SAMPLED)
 
-            time.sleep(0.5)
             # score has to be lower or eq to 1, as one is the best score, you can implement your custom logic
             if score <= 1:
                 score_dict[mid] = score
             else:
-                print('WARN: score > 1. Uid:', mid, score)
+                logger.warning('Score > 1. Uid: %s %s', mid, score)
 
-        if not score_dict:
-            log("No miner managed to give a valid answer")
-            return None
+        return score_dict
+
+    async def submit_scores(self, score_dict: dict[int, float], settings: ValidatorSettings) -> None:
+        """
+        Upload the voting to the backend and set the weights on chain.
 
-        print('all scores', score_dict.items())
+        Args:
+            score_dict: A dictionary mapping miner uids to their scores.
+            settings: The validator settings.
+        """
 
         await self.register_latest_voting(score_dict)
 
         # the blockchain call to set the weights
-        _ = set_weights(settings, score_dict, self.netuid, self.client, self.key)
+        await asyncio.to_thread(set_weights, settings, score_dict, self.netuid, self.client, self.key)
+
+    async def validate_step(
+            self, syntia_netuid: int, settings: ValidatorSettings
+    ) -> None:
+        prepared = await self.prepare_step(settings)
+        if prepared is None:
+            return None
+
+        score_dict = await self.score_miners(*prepared, settings)
+        if not score_dict:
+            logger.info("No miner managed to give a valid answer")
+            return None
+
+        logger.info('All scores: %s', score_dict)
+
+        await self.submit_scores(score_dict, settings)
+
+    async def pipelined_validation_loop(self, settings: ValidatorSettings) -> None:
+        """
+        Run validation steps back to back, overlapping consecutive steps.
+
+        The voting upload and weight submission of a step run in the
+        background while the next step refreshes the metagraph, fetches its
+        prompts and queries the miners. Submissions run one at a time, in
+        step order, so an older vote never lands after a newer one and two
+        extrinsics signed by the validator key never race for a nonce. When
+        a step finishes while an older one is still waiting to be submitted,
+        the older one is dropped: only the newest scores matter. At most
+        `max_steps_in_flight` steps are started but not yet submitted; when
+        that bound is reached the next step waits for an older submission
+        to finish. Steps start every `iteration_interval` seconds, or right
+        away when a step ran late.
+
+        Args:
+            settings: The validator settings to use for the validation loop.
+        """
+
+        steps_in_flight = asyncio.Semaphore(settings.max_steps_in_flight)
+        pending: dict[int, float] | None = None
+        submitter: asyncio.Task | None = None
+        next_start = time.time()
+
+        async def submit_latest() -> None:
+            nonlocal pending
+            while pending is not None:
+                score_dict, pending = pending, None
+                try:
+                    await self.submit_scores(score_dict, settings)
+                except Exception as e:
+                    logger.warning("Failed to submit the scores of a step: %s", e)
+                finally:
+                    steps_in_flight.release()
+
+        while True:
+            await steps_in_flight.acquire()
+            try:
+                prepared = await self.prepare_step(settings)
+                score_dict = await self.score_miners(*prepared, settings) if prepared else {}
+            except BaseException:
+                steps_in_flight.release()
+                raise
+
+            if score_dict:
+                logger.info('All scores: %s', score_dict)
+                if pending is not None:
+                    logger.info("Dropping the scores of an older step that were not submitted yet")
+                    steps_in_flight.release()
+                pending = score_dict
+                if submitter is None or submitter.done():
+                    submitter = asyncio.create_task(submit_latest())
+            else:
+                if prepared:
+                    logger.info("No miner managed to give a valid answer")
+                steps_in_flight.release()
+
+            next_start += settings.iteration_interval
+            sleep_time = next_start - time.time()
+            if sleep_time > 0:
+                logger.info("Sleeping for %.1fs", sleep_time)
+                await asyncio.sleep(sleep_time)
+            else:
+                next_start = time.time()
 
     def validation_loop(self, settings: ValidatorSettings) -> None:
         """
@@ -276,12 +307,19 @@ class TwitterValidator(Module):
             settings: The validator settings to use for the validation loop.
         """
 
+        # a single loop for the whole run keeps pooled miner connections alive between steps
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        if settings.pipelined:
+            loop.run_until_complete(self.pipelined_validation_loop(settings))
+            return
+
         while True:
             start_time = time.time()
-            _ = asyncio.run(self.validate_step(self.netuid, settings))
+            _ = loop.run_until_complete(self.validate_step(self.netuid, settings))
 
             elapsed = time.time() - start_time
             if elapsed < settings.iteration_interval:
                 sleep_time = settings.iteration_interval - elapsed
-                log(f"Sleeping for {sleep_time}")
+                logger.info("Sleeping for %.1fs", sleep_time)
                 time.sleep(sleep_time)
@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+from subnet.miner.ratelimit import Priority, RateLimitExceeded, UpstreamScheduler
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Response:
+    def __init__(self, remaining: int, reset_at: float, status_code: int = 200) -> None:
+        self.status_code = status_code
+        self.headers = {
+            "x-rate-limit-remaining": str(remaining),
+            "x-rate-limit-reset": str(reset_at),
+            "x-rate-limit-limit": "450",
+        }
+
+
+def answer(response: Response, calls: list | None = None, name: str | None = None):
+    async def call():
+        if calls is not None:
+            calls.append(name)
+        return response
+    return call
+
+
+async def exhaust(scheduler: UpstreamScheduler, reset_at: float) -> None:
+    with pytest.raises(RateLimitExceeded):
+        await scheduler.submit(answer(Response(0, reset_at, status_code=429)))
+
+
+def test_reserve_is_kept_for_priority_zero():
+    async def main():
+        clock = Clock()
+        scheduler = UpstreamScheduler(reserve=2, clock=clock)
+        reset_at = clock.now + 900
+        await scheduler.submit(answer(Response(3, reset_at)), priority=1)
+        assert scheduler.remaining == 3
+
+        await scheduler.submit(answer(Response(2, reset_at)), priority=1)
+        assert scheduler.remaining == 2
+        with pytest.raises(RateLimitExceeded):
+            await scheduler.submit(answer(Response(1, reset_at)), priority=1, deadline=clock.now + 0.05)
+
+        await scheduler.submit(answer(Response(1, reset_at)), priority=0)
+        assert scheduler.remaining == 1
+
+    asyncio.run(main())
+
+
+def test_fails_fast_when_the_reset_is_past_the_deadline():
+    async def main():
+        clock = Clock()
+        scheduler = UpstreamScheduler(clock=clock)
+        await exhaust(scheduler, reset_at=clock.now + 900)
+
+        calls = []
+        with pytest.raises(RateLimitExceeded):
+            await asyncio.wait_for(
+                scheduler.submit(answer(Response(450, clock.now + 1800), calls), deadline=clock.now + 10),
+                timeout=1,
+            )
+        assert calls == []
+
+    asyncio.run(main())
+
+
+def test_waits_for_the_reset():
+    async def main():
+        clock = Clock()
+        scheduler = UpstreamScheduler(clock=clock)
+        reset_at = clock.now + 0.05
+        await exhaust(scheduler, reset_at=reset_at)
+
+        calls = []
+        waiting = asyncio.create_task(scheduler.submit(answer(Response(449, clock.now + 900), calls)))
+        await asyncio.sleep(0)
+        assert calls == []
+
+        clock.now = reset_at + 1
+        await asyncio.wait_for(waiting, timeout=1)
+        assert calls == [None]
+
+    asyncio.run(main())
+
+
+def test_promote_moves_a_waiting_call_up():
+    async def main():
+        clock = Clock()
+        scheduler = UpstreamScheduler(max_in_flight=1, clock=clock)
+        reset_at = clock.now + 0.05
+        await exhaust(scheduler, reset_at=reset_at)
+
+        calls = []
+        prefetch = Priority(5)
+        waiting = [
+            asyncio.create_task(scheduler.submit(answer(Response(449, clock.now + 900), calls, "prefetch"), prefetch)),
+            asyncio.create_task(scheduler.submit(answer(Response(448, clock.now + 900), calls, "query"), 1)),
+        ]
+        await asyncio.sleep(0)
+
+        scheduler.promote(prefetch, 0)
+        assert prefetch.value == 0
+        # a lower value is not a promotion
+        scheduler.promote(prefetch, 3)
+        assert prefetch.value == 0
+
+        clock.now = reset_at + 1
+        await asyncio.wait_for(asyncio.gather(*waiting), timeout=1)
+        assert calls == ["prefetch", "query"]
+
+    asyncio.run(main())
+
+
+def test_cancelled_call_hands_back_a_granted_slot():
+    async def main():
+        clock = Clock()
+        scheduler = UpstreamScheduler(max_in_flight=1, clock=clock)
+        reset_at = clock.now + 900
+        await exhaust(scheduler, reset_at=reset_at)
+
+        calls = []
+        waiting = asyncio.create_task(scheduler.submit(answer(Response(449, clock.now + 1800), calls)))
+        await asyncio.sleep(0)
+
+        # the window resets and the slot is granted, but the caller gives up before it resumes
+        clock.now = reset_at + 1
+        scheduler._dispatch()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert calls == []
+
+        # the slot is free again
+        await asyncio.wait_for(scheduler.submit(answer(Response(449, clock.now + 900), calls)), timeout=1)
+        assert calls == [None]
+
+    asyncio.run(main())
+
+
+def test_late_caller_gives_up_at_its_deadline():
+    async def main():
+        clock = Clock()
+        scheduler = UpstreamScheduler(clock=clock)
+        # the window is due to reset before the deadline, but the clock never gets there
+        await exhaust(scheduler, reset_at=clock.now + 0.01)
+
+        calls = []
+        with pytest.raises(RateLimitExceeded):
+            await scheduler.submit(answer(Response(449, clock.now + 900), calls), deadline=clock.now + 0.05)
+        assert calls == []
+        assert scheduler._queue == []
+
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from subnet.miner import store as store_module
+from subnet.miner.store import TweetStore
+
+FIXTURE = json.loads((Path(__file__).parent / "fixtures" / "search_btc.json").read_text())
+QUERY = FIXTURE["query"]
+START = FIXTURE["start_time"]
+MAX_RESULTS = FIXTURE["max_results"]
+
+
+def page(name: str) -> list[dict]:
+    return FIXTURE["pages"][name].get("data", [])
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TweetStore(str(tmp_path / "store.db"))
+    yield store
+    store.close()
+
+
+def test_complete_page_answers_any_size_and_narrower_start(store):
+    store.save(QUERY, START, page("initial"), MAX_RESULTS)
+
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) == page("initial")
+    assert store.lookup(QUERY, START, 3, max_age=60) == page("initial")[:3]
+    # only the tweets from 05:30 on
+    assert store.lookup(QUERY, "2024-04-17T05:30:00.000Z", MAX_RESULTS, max_age=60) == page("initial")[:4]
+
+
+def test_earlier_start_than_covered_goes_upstream(store):
+    store.save(QUERY, START, page("initial"), MAX_RESULTS)
+
+    assert store.lookup(QUERY, "2024-04-16T05:00:00.000Z", MAX_RESULTS, max_age=60) is None
+    assert store.sync_point(QUERY, "2024-04-16T05:00:00.000Z") is None
+
+
+def test_unknown_query_goes_upstream(store):
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) is None
+    assert store.sync_point(QUERY, START) is None
+
+
+def test_full_page_only_answers_up_to_its_size(store):
+    store.save(QUERY, START, page("burst"), MAX_RESULTS)
+
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) == page("burst")
+    assert store.lookup(QUERY, START, 5, max_age=60) == page("burst")[:5]
+    # older tweets may exist upstream past the page
+    assert store.lookup(QUERY, START, 2 * MAX_RESULTS, max_age=60) is None
+    assert store.lookup(QUERY, "2024-04-17T09:00:00.000Z", MAX_RESULTS, max_age=60) is None
+
+
+def test_stale_sync_goes_upstream(store, monkeypatch):
+    store.save(QUERY, START, page("initial"), MAX_RESULTS)
+    synced_at = store_module.time.time()
+
+    monkeypatch.setattr(store_module.time, "time", lambda: synced_at + 61)
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) is None
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=120) == page("initial")
+
+
+def test_incremental_page_extends_the_stored_results(store):
+    store.save(QUERY, START, page("initial"), MAX_RESULTS)
+    since_id = store.sync_point(QUERY, START)
+    assert since_id == page("initial")[0]["id"]
+
+    store.save(QUERY, START, page("newer"), MAX_RESULTS, since_id)
+
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) == page("newer") + page("initial")
+    assert store.sync_point(QUERY, START) == page("newer")[0]["id"]
+
+
+def test_empty_incremental_page_keeps_the_sync_point(store):
+    store.save(QUERY, START, page("initial"), MAX_RESULTS)
+    since_id = store.sync_point(QUERY, START)
+
+    store.save(QUERY, START, page("none_newer"), MAX_RESULTS, since_id)
+
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) == page("initial")
+    assert store.sync_point(QUERY, START) == since_id
+
+
+def test_full_incremental_page_resets_the_index(store):
+    store.save(QUERY, START, page("initial"), MAX_RESULTS)
+    since_id = store.sync_point(QUERY, START)
+
+    # tweets may be missing between the page and the stored ones
+    store.save(QUERY, START, page("burst"), MAX_RESULTS, since_id)
+
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) == page("burst")
+    assert store.lookup(QUERY, START, MAX_RESULTS + 1, max_age=60) is None
+    assert store.sync_point(QUERY, START) == page("burst")[0]["id"]
+
+
+def test_incremental_save_without_coverage_is_a_fresh_search(store):
+    store.save(QUERY, START, page("newer"), MAX_RESULTS, since_id=page("initial")[0]["id"])
+
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) == page("newer")
+
+
+def test_narrower_search_replaces_the_coverage(store):
+    store.save(QUERY, START, page("initial"), MAX_RESULTS)
+    narrower = "2024-04-17T06:00:00.000Z"
+
+    store.save(QUERY, narrower, page("initial")[:2], MAX_RESULTS)
+
+    assert store.lookup(QUERY, narrower, MAX_RESULTS, max_age=60) == page("initial")[:2]
+    assert store.lookup(QUERY, START, MAX_RESULTS, max_age=60) is None